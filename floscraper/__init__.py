@@ -12,9 +12,17 @@ __date__ = "2019-08-04"
 
 from .webscraper import WebScraper, default_user_agents, \
     WEBConnectException, WEBFileException, WEBParameterException
-from .cache import Cache
+from .cache import Cache, FileCache, SqliteCache, NullCache
 from .models import Response, CacheInfo
+from .scheme import CompiledScheme
+try:
+    from .asyncscraper import AsyncWebScraper
+except (ImportError, SyntaxError):
+    # Python 2 (no asyncio)
+    AsyncWebScraper = None
 
 __all__ = [
-    "webscraper", "WebScraper", "Cache", "Response", "CacheInfo"
+    "webscraper", "WebScraper", "Cache", "FileCache", "SqliteCache",
+    "NullCache", "Response", "CacheInfo", "AsyncWebScraper",
+    "CompiledScheme"
 ]
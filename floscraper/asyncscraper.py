@@ -0,0 +1,625 @@
+# -*- coding: UTF-8 -*-
+"""
+Module for loading/scraping data from the web with asyncio
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+__author__ = "the01"
+__email__ = "jungflor@gmail.com"
+__copyright__ = "Copyright (C) 2014-19, Florian JUNG"
+__license__ = "MIT"
+__version__ = "0.1.0"
+__date__ = "2026-10-16"
+# Created: 2026-10-16 14:02
+
+import asyncio
+import copy
+import functools
+import os
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+try:
+    import aiohttp
+    import yarl
+except ImportError:
+    # Not using asyncio api
+    aiohttp = None
+    yarl = None
+
+from .webscraper import WebScraper, WEBConnectException, \
+    WEBParameterException, _host
+from .concurrency import BoundedDispatcher
+
+
+class AsyncWebScraper(WebScraper):
+    """
+    WebScraper with coroutine get/scrap built on aiohttp
+
+    Cache access and parsing are run in an executor,
+    so the event loop is not blocked
+    """
+
+    def __init__(self, settings=None):
+        """
+        Initialize object
+
+        :param settings: Settings for instance (default: None)
+        :type settings: dict | None
+        :rtype: None
+        """
+        if aiohttp is None:
+            raise ImportError("aiohttp not available")
+        if settings is None:
+            settings = {}
+        super(AsyncWebScraper, self).__init__(settings)
+        self.max_connections = settings.get('max_connections', 100)
+        """ Maximum number of simultaneous connections (default: 100)
+            :type : int """
+        self.executor = None
+        """ Executor for cache access and parsing
+            (default: None - loop default executor)
+            :type : None | concurrent.futures.Executor """
+        self._client = None
+        """ :type : None | aiohttp.ClientSession """
+        self._inflight = {}
+        """ Running fetches by cache key
+            :type : dict[str | unicode, asyncio.Future] """
+        self._revalidate_tasks = set()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    def _client_init(self):
+        """
+        Init the aiohttp session if not setup (needs running loop)
+
+        :rtype: None
+        """
+        if self._client:
+            return
+        if not self.session:
+            self._browser_init()
+        auth = None
+
+        if self._auth_method in [None, "", "HTTPBasicAuth"]:
+            if self._auth_username is not None:
+                auth = aiohttp.BasicAuth(
+                    self._auth_username, self._auth_password or ""
+                )
+        self._client = aiohttp.ClientSession(
+            auth=auth,
+            connector=aiohttp.TCPConnector(
+                limit=self.max_connections, force_close=not self.keep_alive
+            )
+        )
+
+    async def close(self):
+        """
+        Stop background refreshes and close connections
+
+        :rtype: None
+        """
+        tasks = list(self._revalidate_tasks) + list(self._inflight.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        if self._client:
+            await self._client.close()
+            self._client = None
+
+    def _run(self, func, *args, **kwargs):
+        """
+        Run blocking function in executor
+
+        :param func: Function to run
+        :type func: callable
+        :return: Future of result
+        :rtype: asyncio.Future
+        """
+        return asyncio.get_event_loop().run_in_executor(
+            self.executor, functools.partial(func, *args, **kwargs)
+        )
+
+    async def request(
+            self, method, url, timeout=None,
+            headers=None, data=None, params=None, sink=None
+    ):
+        """
+        Make a request using aiohttp
+
+        The body is streamed if max_body_size or sink is set
+
+        :param method: Which http method to use (GET/POST)
+        :type method: str | unicode
+        :param url: Url to make request to
+        :type url: str | unicode
+        :param timeout: Timeout for request (default: None)
+            None -> infinite timeout
+        :type timeout: None | int | float
+        :param headers: Headers to be passed along (default: None)
+        :type headers: None | dict
+        :param data: Data to be passed along (e.g. body in POST)
+            (default: None)
+        :type data: None | dict
+        :param params: Parameters to be passed along (e.g. with url in GET)
+            (default: None)
+        :type params: None | dict
+        :param sink: Write body of successful response to this file
+            instead of keeping it in memory (default: None)
+        :type sink: None | file
+        :return: Response to the request
+        :rtype: requests.Response
+        :raises WEBConnectException: Loading failed
+        """
+        self._client_init()
+        # Same url encoding (and cache key) as requests
+        prepared = requests.PreparedRequest()
+        prepared.prepare_url(url, params)
+        # Cookies and auth are added by aiohttp
+        send_headers = CaseInsensitiveDict(self.session.headers)
+        send_headers.update(headers or {})
+        retries = 0
+        retry_wait = 0.0
+        started = time.time()
+
+        while True:
+            wait = self._throttle_wait(url)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            response = error = None
+            try:
+                async with self._client.request(
+                    method,
+                    yarl.URL(prepared.url, encoded=True),
+                    timeout=aiohttp.ClientTimeout(total=timeout),
+                    allow_redirects=self._handle_redirect,
+                    headers=dict(send_headers),
+                    data=data
+                ) as resp:
+                    body = await self._read_body(
+                        url, resp, sink if resp.status < 400 else None
+                    )
+            except WEBConnectException:
+                raise
+            except aiohttp.ClientSSLError as e:
+                raise WEBConnectException(e)
+            except asyncio.TimeoutError:
+                error = WEBConnectException("Timeout loading {}".format(url))
+            except aiohttp.ClientError:
+                error = WEBConnectException("Failed to load {}".format(url))
+            except Exception:
+                self.exception("Failed to load {}".format(url))
+                raise WEBConnectException(
+                    "Unknown failure loading {}".format(url)
+                )
+            else:
+                response = self._to_response(resp, body)
+                response.history = [
+                    self._to_response(r, b"") for r in resp.history
+                ]
+            wait = self._retry_wait(
+                method, url, retries, started, response, error
+            )
+            if wait is None:
+                break
+            retries += 1
+            retry_wait += wait
+            await asyncio.sleep(wait)
+        if error is not None:
+            raise error
+        response.retries = retries
+        response.retry_wait = retry_wait
+        return response
+
+    async def _read_body(self, url, resp, sink=None):
+        """
+        Read body (streamed into memory or sink if max_body_size or sink)
+
+        :param url: Requested url
+        :type url: str | unicode
+        :param resp: Response of aiohttp
+        :type resp: aiohttp.ClientResponse
+        :param sink: Write body to this file (default: None - into memory)
+        :type sink: None | file
+        :return: Body (None if written to sink)
+        :rtype: None | bytes
+        :raises WEBConnectException: Body too large or failed after writing
+            to sink
+        """
+        if self.max_body_size is None and sink is None:
+            return await resp.read()
+        self._check_body_size(url, resp.headers.get('Content-Length'))
+        chunks = []
+        size = 0
+
+        try:
+            async for chunk in resp.content.iter_chunked(self.chunk_size):
+                size += len(chunk)
+                self._check_body_size(url, size)
+                if sink is None:
+                    chunks.append(chunk)
+                else:
+                    await self._run(sink.write, chunk)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if sink is not None and size:
+                # Partially written -> retry would append to sink
+                raise WEBConnectException("Unable to load {}".format(url))
+            raise
+        if sink is not None:
+            return None
+        return b"".join(chunks)
+
+    @staticmethod
+    def _to_response(resp, body):
+        """
+        Convert aiohttp response to requests response
+
+        :param resp: Response of aiohttp
+        :type resp: aiohttp.ClientResponse
+        :param body: Body of response
+        :type body: bytes
+        :return: Response
+        :rtype: requests.Response
+        """
+        response = requests.Response()
+        response.status_code = resp.status
+        response.reason = resp.reason
+        response.url = str(resp.url)
+        response.headers = CaseInsensitiveDict(resp.headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = body
+        response._content_consumed = True
+        request = requests.PreparedRequest()
+        request.prepare(
+            method=resp.method,
+            url=str(resp.request_info.url),
+            headers=dict(resp.request_info.headers)
+        )
+        response.request = request
+        return response
+
+    async def get(
+            self, url, timeout=None, headers=None, params=None, cache_ext=None
+    ):
+        """
+        Make get request to url (might use cache)
+
+        :param url: Url to make request to
+        :type url: str | unicode
+        :param timeout: Timeout for request (default: None)
+            None -> infinite timeout
+        :type timeout: None | int | float
+        :param headers: Headers to be passed along (default: None)
+        :type headers: None | dict
+        :param params: Parameters to be passed along with url (default: None)
+        :type params: None | dict
+        :param cache_ext: External cache info
+        :type cache_ext: floscraper.models.CacheInfo
+        :return: Response
+        :rtype: floscraper.models.Response | None
+        :raises WEBConnectException: Loading failed
+        """
+        if headers is None:
+            headers = {}
+        if not self.session:
+            self._browser_init()
+        cached, cache_info, stale = await self._run(
+            self._get_cached, url, headers, params, cache_ext
+        )
+        if cached:
+            if stale:
+                self._revalidate(
+                    url, timeout, headers, params, cache_info.clone()
+                )
+            return cached
+        # Not using cached
+        return await self._fetch_shared(
+            self._flight_key(url, headers, params),
+            url, timeout, headers, params, cache_info
+        )
+
+    async def _fetch_shared(self, key, *args):
+        """
+        Fetch url - concurrent fetches of same key share one request
+
+        :param key: Key of request (see _flight_key)
+        :type key: str | unicode
+        :param args: Arguments for _fetch
+        :type args: tuple
+        :return: Response
+        :rtype: floscraper.models.Response
+        :raises WEBConnectException: Loading failed
+        """
+        fut = self._inflight.get(key)
+        if fut is not None:
+            res = await asyncio.shield(fut)
+            # Result of other task - do not share mutable objects
+            res = copy.copy(res)
+            if res.cache_info:
+                res.cache_info = res.cache_info.clone()
+            return res
+        fut = asyncio.ensure_future(self._fetch(*args))
+        self._inflight[key] = fut
+        fut.add_done_callback(lambda f: self._inflight.pop(key, None))
+        return await asyncio.shield(fut)
+
+    async def _fetch(
+            self, url, timeout, headers, params, cache_info, store_error=True
+    ):
+        """
+        Load url from web (conditional request if cache info given)
+        and update cache
+
+        :param url: Url to make request to
+        :type url: str | unicode
+        :param timeout: Timeout for request
+        :type timeout: None | int | float
+        :param headers: Headers to be passed along
+        :type headers: dict
+        :param params: Parameters to be passed along with url
+        :type params: None | dict
+        :param cache_info: Cache info of previously cached response
+        :type cache_info: None | floscraper.models.CacheInfo
+        :param store_error: Remember failure in cache (default: True)
+        :type store_error: bool
+        :return: Response
+        :rtype: floscraper.models.Response
+        :raises WEBConnectException: Loading failed
+        """
+        # Headers the response is cached for (without conditional headers)
+        request_headers = self._request_headers(url, headers, params)
+        if self.cache:
+            headers = self.cache.prepare_headers(headers, cache_info)
+
+        try:
+            response = await self._get(
+                url,
+                timeout=timeout,
+                headers=headers,
+                params=params
+            )
+        except WEBConnectException as e:
+            if store_error:
+                await self._run(
+                    self._put_error, url, params, request_headers, e,
+                    self.connect_error_ttl
+                )
+            raise
+        return await self._run(
+            self._handle_response, url, params, request_headers, cache_info,
+            response, store_error
+        )
+
+    def _revalidate(self, url, timeout, headers, params, cache_info):
+        """
+        Refresh stale cache entry in background task
+
+        :param url: Url to refresh
+        :type url: str | unicode
+        :param timeout: Timeout for request
+        :type timeout: None | int | float
+        :param headers: Headers to be passed along
+        :type headers: dict
+        :param params: Parameters to be passed along with url
+        :type params: None | dict
+        :param cache_info: Cache info of stale entry
+        :type cache_info: floscraper.models.CacheInfo
+        :rtype: None
+        """
+        key = self._flight_key(url, headers, params)
+        if key in self._revalidating:
+            # Already running
+            return
+        self._revalidating.add(key)
+        task = asyncio.ensure_future(self._revalidate_task(
+            key, url, timeout, dict(headers), params, cache_info
+        ))
+        self._revalidate_tasks.add(task)
+        task.add_done_callback(self._revalidate_tasks.discard)
+
+    async def _revalidate_task(
+            self, key, url, timeout, headers, params, cache_info
+    ):
+        try:
+            await self._fetch_shared(
+                key, url, timeout, headers, params, cache_info, False
+            )
+            self.debug("Revalidated {}".format(url))
+        except WEBConnectException as e:
+            self.warning("Failed to revalidate {}: {}".format(url, e))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.exception("Failed to revalidate {}".format(url))
+        finally:
+            self._revalidating.discard(key)
+
+    async def scrap(
+            self, url=None, scheme=None, timeout=None,
+            html_parser=None, cache_ext=None
+    ):
+        """
+        Scrap a url and parse the content according to scheme
+
+        :param url: Url to parse (default: self._url)
+        :type url: str
+        :param scheme: Scheme to apply to html (default: self._scheme)
+        :type scheme: dict
+        :param timeout: Timeout for http operation (default: self._timout)
+        :type timeout: float
+        :param html_parser: What html parser to use
+            (default: self._html_parser)
+        :type html_parser: str | unicode
+        :param cache_ext: External cache info
+        :type cache_ext: floscraper.models.CacheInfo
+        :return: Response data from url and parsed info
+        :rtype: floscraper.models.Response
+        :raises WEBConnectException: HTTP get failed
+        :raises WEBParameterException: Missing scheme or url
+        """
+        if not url:
+            url = self.url
+        if not scheme:
+            scheme = self._default_scheme()
+        if not timeout:
+            timeout = self.timeout
+        if not html_parser:
+            html_parser = self.html_parser
+        if not scheme:
+            raise WEBParameterException("Missing scheme definition")
+        if not url:
+            raise WEBParameterException("Missing url definition")
+        scheme = self.compile_scheme(scheme)
+        resp = await self.get(url, timeout, cache_ext=cache_ext)
+        resp.scraped = await self._run(
+            self._scrap_response, resp, scheme, html_parser
+        )
+        return resp
+
+    async def download(
+            self, url, sink, timeout=None, headers=None, params=None
+    ):
+        """
+        Stream url into file (not cached)
+
+        :param url: Url to download
+        :type url: str | unicode
+        :param sink: Path or file object to write body to
+        :type sink: str | unicode | file
+        :param timeout: Timeout for request (default: None)
+        :type timeout: None | int | float
+        :param headers: Headers to be passed along (default: None)
+        :type headers: None | dict
+        :param params: Parameters to be passed along with url (default: None)
+        :type params: None | dict
+        :return: Response (without body)
+        :rtype: floscraper.models.Response
+        :raises WEBConnectException: Loading failed
+        """
+        path = None
+        if not hasattr(sink, "write"):
+            path = sink
+            sink = await self._run(open, path, "wb")
+        try:
+            response = await self._get(
+                url, timeout=timeout, headers=headers, params=params,
+                sink=sink
+            )
+        except:
+            if path is not None:
+                await self._run(sink.close)
+                await self._run(os.remove, path)
+            raise
+        if path is not None:
+            await self._run(sink.close)
+        return await self._run(self._download_response, url, response, path)
+
+    async def get_many(
+            self, urls, max_workers=10, per_host_limit=None, timeout=None,
+            headers=None, params=None
+    ):
+        """
+        Make get requests to urls concurrently (might use cache)
+
+        Responses are yielded as they complete (not in order of urls).
+        Failed requests yield a response with error set instead of raising
+
+        :param urls: Urls to request (read lazily)
+        :type urls: collections.Iterable[str | unicode]
+        :param max_workers: Maximum number of simultaneous requests
+            (default: 10)
+        :type max_workers: int
+        :param per_host_limit: Maximum number of simultaneous requests
+            per host (default: None - no limit)
+        :type per_host_limit: None | int
+        :param timeout: Timeout for request (default: None)
+        :type timeout: None | int | float
+        :param headers: Headers to be passed along (default: None)
+        :type headers: None | dict
+        :param params: Parameters to be passed along with url (default: None)
+        :type params: None | dict
+        :return: Responses (with url set)
+        :rtype: collections.AsyncIterable[floscraper.models.Response]
+        """
+        def get(url):
+            # Copy headers - cache adds conditional headers
+            return self.get(url, timeout, dict(headers or {}), params)
+
+        async for res in self._many(get, urls, max_workers, per_host_limit):
+            yield res
+
+    async def scrap_many(
+            self, urls, scheme=None, max_workers=10, per_host_limit=None,
+            timeout=None, html_parser=None
+    ):
+        """
+        Scrap urls concurrently and parse the content according to scheme
+
+        Responses are yielded as they complete (not in order of urls).
+        Failed requests yield a response with error set instead of raising
+
+        :param urls: Urls to parse (read lazily)
+        :type urls: collections.Iterable[str | unicode]
+        :param scheme: Scheme to apply to html (default: self._scheme)
+        :type scheme: dict
+        :param max_workers: Maximum number of simultaneous requests
+            (default: 10)
+        :type max_workers: int
+        :param per_host_limit: Maximum number of simultaneous requests
+            per host (default: None - no limit)
+        :type per_host_limit: None | int
+        :param timeout: Timeout for http operation (default: self._timout)
+        :type timeout: float
+        :param html_parser: What html parser to use
+            (default: self._html_parser)
+        :type html_parser: str | unicode
+        :return: Responses (with url set)
+        :rtype: collections.AsyncIterable[floscraper.models.Response]
+        """
+        # Compile once for all urls
+        scheme = self.compile_scheme(scheme) or self._default_scheme()
+
+        def scrap(url):
+            return self.scrap(url, scheme, timeout, html_parser)
+
+        async for res in self._many(scrap, urls, max_workers, per_host_limit):
+            yield res
+
+    async def _many(self, func, urls, max_workers, per_host_limit):
+        dispatcher = BoundedDispatcher(
+            urls, max_workers, _host, per_host_limit
+        )
+        running = {}
+
+        def start(items):
+            for url in items:
+                running[asyncio.ensure_future(func(url))] = url
+
+        start(dispatcher.next_items())
+        try:
+            while running:
+                done, _ = await asyncio.wait(
+                    list(running), return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    url = running.pop(task)
+                    start(dispatcher.done(url))
+                    try:
+                        res, error = task.result(), None
+                    except Exception as e:
+                        res, error = None, e
+                    yield self._many_result(url, res, error)
+        finally:
+            for task in running:
+                task.cancel()
@@ -8,37 +8,309 @@ __author__ = "d01"
 __email__ = "jungflor@gmail.com"
 __copyright__ = "Copyright (C) 2017-19, Florian JUNG"
 __license__ = "MIT"
-__version__ = "0.2.1"
-__date__ = "2019-08-04"
+__version__ = "0.3.0"
+__date__ = "2026-10-16"
 # Created: 2017-10-07 15:19
 
 import datetime
+import errno
 import os
+import re
+import sys
 import abc
+import atexit
+import contextlib
 import threading
 import logging
 import hashlib
+import time
+import uuid
+import weakref
+import zlib
+from email.utils import parsedate_tz, mktime_tz
+try:
+    from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+except ImportError:
+    # Python 2
+    from urlparse import urlsplit, urlunsplit, parse_qsl
+    from urllib import urlencode
+from collections import OrderedDict
 from io import open
 
 from flotils import Loadable
+from flotils.loadable import load_json, save_json
+from requests.structures import CaseInsensitiveDict
 
 try:
     import portalocker as porta
 except ImportError:
     # Not using portalocker
     porta = None
+try:
+    import sqlite3
+except ImportError:
+    # Python built without sqlite
+    sqlite3 = None
+try:
+    import lzma
+except ImportError:
+    # Python 2
+    lzma = None
+try:
+    import zstandard
+except ImportError:
+    # Not using zstd
+    zstandard = None
 
-from .models import CacheInfo
+from .models import CacheInfo, Response
 
 
-_cache = {}
-""" temp cache """
-_cache_lock = threading.RLock()
+_flat_body_reg = re.compile(r"^(?:[0-9a-f]{32}|[0-9a-f]{40})\.tmp$")
+""" Body file name in flat layout (entry key or content hash) """
+_digest_body_reg = re.compile(r"^[0-9a-f]{40}\.tmp$")
+""" File name of deduplicated body """
 
 if porta is None:
     logging.warning("Not using portalocker")
 
 
+def _replace(src, dst):
+    """
+    Atomically replace dst with src (if supported by os)
+
+    :param src: File to move
+    :type src: str | unicode
+    :param dst: File to replace
+    :type dst: str | unicode
+    :rtype: None
+    """
+    if hasattr(os, "replace"):
+        os.replace(src, dst)
+        return
+    if os.path.exists(dst):
+        os.remove(dst)
+    os.rename(src, dst)
+
+
+def _zlib_compress(data, level):
+    return zlib.compress(data, 6 if level is None else level)
+
+
+def _lzma_compress(data, level):
+    return lzma.compress(data, preset=level)
+
+
+def _zstd_compress(data, level):
+    return zstandard.ZstdCompressor(
+        level=3 if level is None else level
+    ).compress(data)
+
+
+def _zstd_decompress(data):
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+codecs = {
+    'zlib': (_zlib_compress, zlib.decompress),
+}
+""" Available compression codecs (name -> (compress, decompress)) """
+if lzma:
+    codecs['lzma'] = (_lzma_compress, lzma.decompress)
+if zstandard:
+    codecs['zstd'] = (_zstd_compress, _zstd_decompress)
+
+
+def _makedirs(path):
+    """
+    Create directory (and parents) if it does not exist
+
+    :param path: Directory to create
+    :type path: str | unicode
+    :rtype: None
+    """
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+_default_ports = {
+    'http': 80,
+    'https': 443,
+}
+
+
+def _param_pairs(params):
+    """
+    Flatten request parameters into (name, value) pairs
+
+    :param params: Parameters (like requests params)
+    :type params: None | dict | list[(str | unicode, object)]
+    :return: Pairs (None values are dropped like requests does)
+    :rtype: list[(str | unicode, str | unicode)]
+    """
+    if not params:
+        return []
+    if isinstance(params, dict):
+        params = params.items()
+    res = []
+
+    for name, value in params:
+        if value is None:
+            continue
+        if not isinstance(value, (list, tuple)):
+            value = [value]
+        for val in value:
+            if isinstance(val, bytes):
+                val = val.decode("utf-8")
+            res.append(("{}".format(name), "{}".format(val)))
+    return res
+
+
+def canonical_url(url, params=None):
+    """
+    Normalize url (lowercase scheme/host, no default port or fragment,
+    params merged into query and sorted by name)
+
+    :param url: Url to normalize
+    :type url: str | unicode
+    :param params: Parameters added to the query (default: None)
+    :type params: None | dict | list[(str | unicode, object)]
+    :return: Normalized url
+    :rtype: str | unicode
+    """
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc
+    host = (parts.hostname or "").lower()
+
+    if host:
+        if ":" in host:
+            # IPv6
+            host = "[{}]".format(host)
+        try:
+            port = parts.port
+        except ValueError:
+            port = None
+        if port and port != _default_ports.get(scheme):
+            host = "{}:{}".format(host, port)
+        userinfo = netloc.rpartition("@")[0]
+        netloc = "{}@{}".format(userinfo, host) if userinfo else host
+    path = parts.path
+    if not path and netloc:
+        path = "/"
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    query.extend(_param_pairs(params))
+    # Stable sort - order of repeated names is kept
+    query = sorted(query, key=lambda pair: pair[0])
+    return urlunsplit((
+        scheme, netloc, path,
+        urlencode([
+            (name.encode("utf-8"), val.encode("utf-8"))
+            for name, val in query
+        ]),
+        ""
+    ))
+
+
+def is_vary_marker(cache_info):
+    """
+    Check whether entry only records the header names a response varies on
+    (stored under url key, variants under keys including header values)
+
+    :param cache_info: Cache info of entry
+    :type cache_info: floscraper.models.CacheInfo
+    :return: Entry is vary marker
+    :rtype: bool
+    """
+    return bool(cache_info.vary) and cache_info.size is None
+
+
+def parse_vary(value):
+    """
+    Parse Vary header
+
+    :param value: Header value (e.g. "Accept-Encoding, User-Agent")
+    :type value: None | str | unicode
+    :return: Sorted, lowercase header names (["*"] if not cacheable)
+    :rtype: list[str | unicode]
+    """
+    if not value:
+        return []
+    names = set(
+        name.strip().lower() for name in value.split(",") if name.strip()
+    )
+    if "*" in names:
+        return ["*"]
+    return sorted(names)
+
+
+def parse_cache_control(value):
+    """
+    Parse Cache-Control header
+
+    :param value: Header value (e.g. "public, max-age=60")
+    :type value: None | str | unicode
+    :return: Directives (lowercase) with their value (None if no value)
+    :rtype: dict[str | unicode, None | str | unicode]
+    """
+    res = {}
+    if not value:
+        return res
+
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "=" in part:
+            name, val = part.split("=", 1)
+            res[name.strip().lower()] = val.strip().strip('"')
+        else:
+            res[part.lower()] = None
+    return res
+
+
+def parse_http_date(value):
+    """
+    Parse http date header
+
+    :param value: Header value (e.g. "Wed, 21 Oct 2015 07:28:00 GMT")
+    :type value: None | str | unicode
+    :return: Timestamp or None if invalid
+    :rtype: None | float
+    """
+    if not value:
+        return None
+    parsed = parsedate_tz(value)
+    if parsed is None:
+        return None
+    try:
+        return mktime_tz(parsed)
+    except (OverflowError, ValueError):
+        return None
+
+
+def _journal_generation(line):
+    """
+    Get generation from journal header
+
+    :param line: First line of journal
+    :type line: bytes
+    :return: Generation (None if journal has no header)
+    :rtype: None | str | unicode
+    """
+    if not line.endswith(b"\n"):
+        return None
+    try:
+        header = load_json(line.decode("utf-8"))
+    except ValueError:
+        return None
+    if not isinstance(header, dict):
+        return None
+    return header.get('generation')
+
+
 def now_utc():
     """
     Get current time as utc with tzinfo
@@ -49,6 +321,112 @@ def now_utc():
     return datetime.datetime.utcnow()
 
 
+class LRUStore(object):
+    """ In memory least recently used store bounded by total size in bytes """
+
+    def __init__(self, max_size):
+        """
+        Initialize object
+
+        :param max_size: Maximum total size of stored bodies in bytes
+        :type max_size: int
+        :rtype: None
+        """
+        self.max_size = max_size
+        self.size = 0
+        """ Current total size in bytes
+            :type : int """
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        """
+        Get entry and mark it as most recently used
+
+        :param key: Key to get
+        :type key: str | unicode
+        :return: Stored (body, cache info) or None if not found
+        :rtype: None | (object, floscraper.models.CacheInfo)
+        """
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None:
+                return None
+            self._data[key] = entry
+            return entry[0], entry[1]
+
+    def set(self, key, body, cache_info, size=None):
+        """
+        Store entry (evicting least recently used entries if necessary)
+
+        :param key: Key to set
+        :type key: str | unicode
+        :param body: Body to store
+        :type body: object
+        :param cache_info: Cache info to store
+        :type cache_info: floscraper.models.CacheInfo
+        :param size: Size of body in bytes (default: None)
+            None -> sys.getsizeof(body)
+        :type size: None | int
+        :rtype: None
+        """
+        if size is None:
+            size = sys.getsizeof(body)
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= old[2]
+            if size > self.max_size:
+                # Would evict everything else
+                return
+            while self._data and self.size + size > self.max_size:
+                _, evicted = self._data.popitem(last=False)
+                self.size -= evicted[2]
+            self._data[key] = (body, cache_info, size)
+            self.size += size
+
+    def update(self, key, cache_info):
+        """
+        Replace cache info of entry (if stored)
+
+        :param key: Key to update
+        :type key: str | unicode
+        :param cache_info: New cache info
+        :type cache_info: floscraper.models.CacheInfo
+        :rtype: None
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data[key] = (entry[0], cache_info, entry[2])
+
+    def pop(self, key):
+        """
+        Remove entry
+
+        :param key: Key to remove
+        :type key: str | unicode
+        :rtype: None
+        """
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is not None:
+                self.size -= entry[2]
+
+    def clear(self):
+        """
+        Remove all entries
+
+        :rtype: None
+        """
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+
 class Cache(Loadable):
     """ Cache element """
     __metaclass__ = abc.ABCMeta
@@ -60,6 +438,53 @@ class Cache(Loadable):
         self._duration = datetime.timedelta()
         self.duration = settings.get('duration', 7 * 60)
         self.use_advanced = settings.get('use_advanced', True)
+        self.compression = settings.get('compression', None)
+        """ Codec to compress stored bodies with (default: None)
+            :type : None | str | unicode """
+        self.compression_level = settings.get('compression_level', None)
+        """ Codec specific compression level (default: None - codec default)
+            :type : None | int """
+        if self.compression and self.compression not in codecs:
+            self.warning(
+                "Compression {} not available - using zlib".format(
+                    self.compression
+                )
+            )
+            self.compression = "zlib"
+        self.store_headers = settings.get('store_headers', [
+            "Content-Type", "Content-Language", "Content-Location",
+            "Last-Modified", "ETag", "Cache-Control", "Expires", "Date",
+            "Age", "Vary", "Link",
+        ])
+        """ Response headers to store with each entry
+            :type : list[str | unicode] """
+        self.use_cache_control = settings.get('use_cache_control', False)
+        """ Use Cache-Control/Expires/Age headers for freshness of entries
+            (default: False)
+            :type : bool """
+        self.max_entries = settings.get('max_entries', None)
+        """ Maximum number of entries kept by gc (default: None - no limit)
+            :type : None | int """
+        self.max_bytes = settings.get('max_bytes', None)
+        """ Maximum size of stored bodies kept by gc
+            (default: None - no limit)
+            :type : None | int """
+        self.gc_grace = datetime.timedelta(
+            seconds=settings.get('gc_grace', 0)
+        )
+        """ Keep expired entries this long for conditional requests
+            :type : datetime.timedelta """
+        self._gc_thread = None
+        self._gc_stop = threading.Event()
+        self.dedup = settings.get('dedup', False)
+        """ Store identical bodies only once (keyed by content hash)
+            (default: False)
+            :type : bool """
+        self._refs_lock = threading.RLock()
+        memory_size = settings.get('memory_size', 0)
+        self._memory = LRUStore(memory_size) if memory_size else None
+        """ In memory tier in front of cache storage (bounded by bytes)
+            :type : None | LRUStore """
 
     @property
     def duration(self):
@@ -108,7 +533,203 @@ class Cache(Loadable):
     def _cache_set(self, key, val):
         raise NotImplementedError()
 
-    def get(self, url, ignore_access_time=False):
+    def _cache_meta_items(self):
+        """
+        Get snapshot of all entries
+
+        :return: (key, meta) of all entries
+        :rtype: list[(str | unicode, object)]
+        """
+        raise NotImplementedError()
+
+    def _cache_delete(self, key, access_time=None):
+        """
+        Remove entry (meta and body)
+
+        :param key: Key of entry
+        :type key: str | unicode
+        :param access_time: Only remove if entry still has this access time
+            (default: None) None -> always remove
+        :type access_time: None | datetime.datetime
+        :return: Entry was removed
+        :rtype: bool
+        """
+        raise NotImplementedError()
+
+    def key(self, url, params=None, headers=None, vary=None, method="GET"):
+        """
+        Get cache key for request
+
+        Built from the canonical url (see canonical_url()), the method
+        (if not GET) and the values of the request headers named in vary
+
+        :param url: Url of request
+        :type url: str | unicode
+        :param params: Parameters of request (default: None)
+        :type params: None | dict | list[(str | unicode, object)]
+        :param headers: Headers of request (default: None)
+        :type headers: None | dict | requests.structures.CaseInsensitiveDict
+        :param vary: Names of headers (lowercase) the response varies on
+            (default: None)
+        :type vary: None | list[str | unicode]
+        :param method: Http method (default: GET)
+        :type method: str | unicode
+        :return: Cache key
+        :rtype: str | unicode
+        """
+        ident = canonical_url(url, params)
+        if method and method.upper() != "GET":
+            ident = "{} {}".format(method.upper(), ident)
+        if vary:
+            lower = dict(
+                (name.lower(), value)
+                for name, value in (headers or {}).items()
+            )
+            for name in vary:
+                ident += "\n{}:{}".format(name, lower.get(name, ""))
+        return hashlib.md5(ident.encode("utf-8")).hexdigest()
+
+    def _lookup(self, key):
+        """
+        Get entry from memory tier or cache info from storage
+
+        :param key: Cache key
+        :type key: str | unicode
+        :return: (memory entry (raw body), cache info)
+        :rtype: (None | bytes, None | floscraper.models.CacheInfo)
+        """
+        if self._memory is not None:
+            memory = self._memory.get(key)
+            if memory:
+                return memory[0], memory[1].clone()
+        accessed = self._cache_meta_get(key)
+        if not accessed:
+            return None, None
+        return None, self._to_cache_info(accessed)
+
+    def _resolve_key(self, url, params=None, headers=None, vary=None):
+        """
+        Get key of entry (variant key if response varies on headers)
+
+        :param url: Url of request
+        :type url: str | unicode
+        :param params: Parameters of request (default: None)
+        :type params: None | dict | list[(str | unicode, object)]
+        :param headers: Headers of request (default: None)
+        :type headers: None | dict | requests.structures.CaseInsensitiveDict
+        :param vary: Header names response varies on (default: None)
+            None -> look up in cache
+        :type vary: None | list[str | unicode]
+        :return: Cache key
+        :rtype: str | unicode
+        """
+        key = self.key(url, params)
+        if vary is None:
+            _, cached = self._lookup(key)
+            vary = cached.vary if cached else None
+        if vary:
+            return self.key(url, params, headers, vary)
+        return key
+
+    def _cache_body_delete(self, key):
+        """
+        Remove body only
+
+        :param key: Key of body
+        :type key: str | unicode
+        :rtype: None
+        """
+        raise NotImplementedError()
+
+    @staticmethod
+    def _to_cache_info(accessed):
+        """
+        Create cache info from stored meta
+
+        :param accessed: Stored meta (dict or access time of old versions)
+        :type accessed: dict | datetime.datetime
+        :return: Cache info
+        :rtype: floscraper.models.CacheInfo
+        """
+        if isinstance(accessed, dict):
+            return CacheInfo.from_dict(accessed)
+        return CacheInfo(accessed)
+
+    def is_expired(self, cache_info, now=None):
+        """
+        Check whether entry is no longer fresh
+
+        :param cache_info: Cache info of entry
+        :type cache_info: floscraper.models.CacheInfo
+        :param now: Current time (default: None) None -> now_utc()
+        :type now: None | datetime.datetime
+        :return: Entry expired
+        :rtype: bool
+        """
+        if now is None:
+            now = now_utc()
+        if not cache_info.access_time:
+            return True
+        duration = self.duration
+        if cache_info.max_age is not None:
+            duration = datetime.timedelta(seconds=cache_info.max_age)
+        return now - cache_info.access_time > duration
+
+    @staticmethod
+    def has_response(cache_info):
+        """
+        Check whether entry holds a response of a successful request
+        (not only a remembered failure)
+
+        :param cache_info: Cache info of entry
+        :type cache_info: floscraper.models.CacheInfo
+        :return: Response stored
+        :rtype: bool
+        """
+        if cache_info.status_code is not None:
+            return cache_info.status_code < 400
+        return cache_info.headers is not None or not cache_info.error
+
+    def freshness(self, headers):
+        """
+        Get storability and freshness lifetime from response headers
+        (Cache-Control, Expires, Date and Age)
+
+        :param headers: Response headers
+        :type headers: requests.structures.CaseInsensitiveDict
+        :return: (store, max_age)
+            store -> False if response must not be cached (no-store)
+            max_age -> Lifetime in seconds (None -> use duration)
+        :rtype: (bool, None | int)
+        """
+        if not self.use_cache_control:
+            return True, None
+        control = parse_cache_control(headers.get('Cache-Control'))
+        if "no-store" in control:
+            return False, None
+        if "no-cache" in control:
+            return True, 0
+        lifetime = None
+
+        if "max-age" in control:
+            try:
+                lifetime = int(control['max-age'])
+            except ValueError:
+                lifetime = 0
+        elif "Expires" in headers:
+            expires = parse_http_date(headers['Expires'])
+            date = parse_http_date(headers.get('Date')) or time.time()
+            # Invalid expires means already expired
+            lifetime = int(expires - date) if expires is not None else 0
+        if lifetime is None:
+            return True, None
+        try:
+            age = int(headers.get('Age') or 0)
+        except ValueError:
+            age = 0
+        return True, max(lifetime - age, 0)
+
+    def get(self, url, ignore_access_time=False, params=None, headers=None):
         """
         Try to retrieve url from cache if available
 
@@ -116,40 +737,103 @@ class Cache(Loadable):
         :type url: str | unicode
         :param ignore_access_time: Should ignore the access time
         :type ignore_access_time: bool
+        :param params: Parameters of request (default: None)
+        :type params: None | dict | list[(str | unicode, object)]
+        :param headers: Headers of request (default: None)
+        :type headers: None | dict | requests.structures.CaseInsensitiveDict
         :return: (data, CacheInfo)
             None, None -> not found in cache
             None, CacheInfo -> found, but is expired
             data, CacheInfo -> found in cache
         :rtype: (None | str | unicode, None | floscraper.models.CacheInfo)
         """
-        key = hashlib.md5(url.encode("utf-8")).hexdigest()
-        accessed = self._cache_meta_get(key)
+        res, cached = self.get_response(
+            url, ignore_access_time, params, headers
+        )
+        if res is None:
+            return None, cached
+        return res.html, cached
 
-        if not accessed:
+    def get_response(
+            self, url, ignore_access_time=False, params=None, headers=None
+    ):
+        """
+        Try to retrieve whole response for url from cache if available
+
+        :param url: Url to retrieve
+        :type url: str | unicode
+        :param ignore_access_time: Should ignore the access time
+        :type ignore_access_time: bool
+        :param params: Parameters of request (default: None)
+        :type params: None | dict | list[(str | unicode, object)]
+        :param headers: Headers of request (default: None)
+            (used if response varies on headers)
+        :type headers: None | dict | requests.structures.CaseInsensitiveDict
+        :return: (Response, CacheInfo)
+            None, None -> not found in cache
+            None, CacheInfo -> found, but is expired
+            Response, CacheInfo -> found in cache
+        :rtype: (None | floscraper.models.Response,
+            None | floscraper.models.CacheInfo)
+        """
+        key = self.key(url, params)
+        memory, cached = self._lookup(key)
+        if cached and cached.vary:
+            # Response varies on request headers -> get variant
+            key = self.key(url, params, headers, cached.vary)
+            memory, cached = self._lookup(key)
+
+        if not cached:
             # Not previously cached
             self.debug("From inet {}".format(url))
             return None, None
-
-        if isinstance(accessed, dict):
-            cached = CacheInfo.from_dict(accessed)
-        else:
-            cached = CacheInfo(accessed)
-        now = now_utc()
-        if now - cached.access_time > self.duration and not ignore_access_time:
+        raw = memory
+        if not ignore_access_time and self.is_expired(cached):
             # Cached expired -> remove
             self.debug("From inet (expired) {}".format(url))
             return None, cached
 
-        try:
-            res = self._cache_get(key)
-        except:
-            self.debug("From inet (failure) {}".format(url))
-            self.exception("Failed to read cache")
-            return None, None
-        self.debug("From cache {}".format(url))
+        if memory is not None:
+            self.debug("From cache (memory) {}".format(url))
+        else:
+            try:
+                raw = self._load_body(
+                    self._cache_get(cached.digest or key), cached
+                )
+            except:
+                self.debug("From inet (failure) {}".format(url))
+                self.exception("Failed to read cache")
+                return None, None
+            if self._memory is not None:
+                self._memory.set(
+                    key, raw, cached.clone(), sys.getsizeof(raw)
+                )
+            self.debug("From cache {}".format(url))
+        # Decoded on access
+        res = Response(None, cached, raw=raw)
+        res.status_code = cached.status_code
+        res.headers = CaseInsensitiveDict(cached.headers or {})
+        res.encoding = cached.encoding
         return res, cached
 
-    def update(self, url, cache_info=None):
+    def select_headers(self, headers):
+        """
+        Select response headers to store with entry
+
+        :param headers: Response headers
+        :type headers: dict | requests.structures.CaseInsensitiveDict
+        :return: Headers to store
+        :rtype: dict
+        """
+        lower = dict((key.lower(), key) for key in headers)
+        res = {}
+
+        for name in self.store_headers:
+            if name.lower() in lower:
+                res[name] = headers[lower[name.lower()]]
+        return res
+
+    def update(self, url, cache_info=None, params=None, headers=None):
         """
         Update cache information for url
 
@@ -157,36 +841,405 @@ class Cache(Loadable):
         :type url: str | unicode
         :param cache_info: Cache info
         :type cache_info: floscraper.models.CacheInfo
+        :param params: Parameters of request (default: None)
+        :type params: None | dict | list[(str | unicode, object)]
+        :param headers: Headers of request (default: None)
+        :type headers: None | dict | requests.structures.CaseInsensitiveDict
         :rtype: None
         """
-        key = hashlib.md5(url.encode("utf-8")).hexdigest()
-        access_time = None
         if not cache_info:
             cache_info = CacheInfo()
-        if not access_time:
-            cache_info.access_time = now_utc()
+        key = self._resolve_key(url, params, headers, cache_info.vary or [])
+        self._update(key, cache_info)
+        if cache_info.vary:
+            self._touch_vary(url, params, cache_info)
+
+    def put_error(self, url, cache_info, params=None, headers=None):
+        """
+        Remember failed request
+
+        A response already stored for url is kept (error is set next to it,
+        so it can still be revalidated once the error expired)
+
+        :param url: Url of failed request
+        :type url: str | unicode
+        :param cache_info: Cache info with error and max_age set
+        :type cache_info: floscraper.models.CacheInfo
+        :param params: Parameters of request (default: None)
+        :type params: None | dict | list[(str | unicode, object)]
+        :param headers: Headers of request (default: None)
+        :type headers: None | dict | requests.structures.CaseInsensitiveDict
+        :rtype: None
+        """
+        key = self.key(url, params)
+        _, cached = self._lookup(key)
+        if cached and cached.vary:
+            # Only fail variant of these request headers
+            cache_info.vary = cached.vary
+            key = self.key(url, params, headers, cached.vary)
+            _, cached = self._lookup(key)
+        if cached and self.has_response(cached):
+            cached.error = cache_info.error
+            cached.max_age = cache_info.max_age
+            self._update(key, cached)
+            if cached.vary:
+                self._touch_vary(url, params, cached)
+            return
+        self.put(url, "", cache_info, params=params, headers=headers)
+
+    def _update(self, key, cache_info):
+        """
+        Set cache information (access time is set to now)
+
+        :param key: Cache key
+        :type key: str | unicode
+        :param cache_info: Cache info
+        :type cache_info: floscraper.models.CacheInfo
+        :rtype: None
+        """
+        cache_info.access_time = now_utc()
         self._cache_meta_set(key, cache_info.to_dict())
+        if self._memory is not None:
+            self._memory.update(key, cache_info.clone())
+
+    @contextlib.contextmanager
+    def _atomic(self):
+        """
+        Write body and meta of an entry together (default: no grouping)
+        """
+        yield
+
+    def _encode_body(self, raw, cache_info):
+        """
+        Prepare body for storage (and set codec in cache info)
+
+        :param raw: Undecoded content
+        :type raw: bytes
+        :param cache_info: Cache info to record codec in
+        :type cache_info: floscraper.models.CacheInfo
+        :return: Data to store
+        :rtype: bytes
+        """
+        cache_info.codec = self.compression
+        if self.compression:
+            return codecs[self.compression][0](raw, self.compression_level)
+        return raw
+
+    def _load_body(self, data, cache_info):
+        """
+        Restore undecoded content from stored body
 
-    def put(self, url, html, cache_info=None):
+        :param data: Stored body
+        :type data: bytes | str | unicode
+        :param cache_info: Cache info of body
+        :type cache_info: floscraper.models.CacheInfo
+        :return: Undecoded content
+        :rtype: bytes
+        """
+        if not isinstance(data, bytes):
+            # Stored as text (previous versions)
+            cache_info.encoding = "utf-8"
+            return data.encode("utf-8")
+        if cache_info.codec:
+            data = codecs[cache_info.codec][1](data)
+        return data
+
+    def put(
+            self, url, html, cache_info=None, raw=None, encoding=None,
+            params=None, headers=None
+    ):
         """
         Put response into cache
 
+        If cache_info.vary is set, the response is stored for the values
+        of these request headers
+
         :param url: Url to cache
         :type url: str | unicode
-        :param html: HTML content of url
-        :type html: str | unicode
+        :param html: HTML content of url (may be None if raw is given)
+        :type html: None | str | unicode
         :param cache_info: Cache Info (default: None)
         :type cache_info: floscraper.models.CacheInfo
+        :param raw: Undecoded content - stored instead of html if encoding
+            is known or html not given (default: None)
+        :type raw: None | bytes
+        :param encoding: Encoding of raw (default: None)
+        :type encoding: None | str | unicode
+        :param params: Parameters of request (default: None)
+        :type params: None | dict | list[(str | unicode, object)]
+        :param headers: Headers of request (default: None)
+        :type headers: None | dict | requests.structures.CaseInsensitiveDict
         :rtype: None
         """
-        key = hashlib.md5(url.encode("utf-8")).hexdigest()
+        if cache_info is None:
+            cache_info = CacheInfo()
+        key = self._resolve_key(url, params, headers, cache_info.vary or [])
+        if raw is None or (not encoding and html is not None):
+            raw = html.encode("utf-8")
+            encoding = "utf-8"
+        cache_info.encoding = encoding
+
+        old = self._cache_meta_get(key)
+        old_digest = old.get('digest') if isinstance(old, dict) else None
 
         try:
-            self._cache_set(key, html)
+            data = self._encode_body(raw, cache_info)
+            cache_info.size = len(data)
+            with self._atomic():
+                if self.dedup:
+                    cache_info.digest = hashlib.sha1(data).hexdigest()
+                    if cache_info.digest != old_digest:
+                        # Not yet referenced by this entry
+                        self._acquire_body(cache_info.digest, data)
+                else:
+                    cache_info.digest = None
+                    self._cache_set(key, data)
+                self._update(key, cache_info)
         except:
+            if self._memory is not None:
+                self._memory.pop(key)
             self.exception("Failed to write cache")
             return
-        self.update(url, cache_info)
+        if old_digest and old_digest != cache_info.digest:
+            self._release_body(old_digest)
+        elif old and not old_digest and cache_info.digest:
+            # Body previously stored under entry key
+            try:
+                self._cache_body_delete(key)
+            except:
+                self.exception("Failed to remove old body")
+        if cache_info.vary:
+            self._touch_vary(url, params, cache_info)
+        if self._memory is not None:
+            self._memory.set(
+                key, raw, cache_info.clone(), sys.getsizeof(raw)
+            )
+
+    def _touch_vary(self, url, params, cache_info):
+        """
+        Write vary marker of url (header names for lookup) - kept as long as
+        the longest lived of its variants
+
+        :param url: Url of variant
+        :type url: str | unicode
+        :param params: Parameters of request
+        :type params: None | dict | list[(str | unicode, object)]
+        :param cache_info: Cache info of updated variant
+        :type cache_info: floscraper.models.CacheInfo
+        :rtype: None
+        """
+        key = self.key(url, params)
+        _, old = self._lookup(key)
+        ages = [cache_info.max_age]
+        if old and is_vary_marker(old) and not self.is_expired(old):
+            ages.append(old.max_age)
+        duration = int(self.duration.total_seconds())
+        max_age = max(duration if age is None else age for age in ages)
+        marker = CacheInfo()
+        marker.vary = cache_info.vary
+        if max_age != duration:
+            marker.max_age = max_age
+        self._update(key, marker)
+
+    def _acquire_body(self, digest, data):
+        """
+        Store body by content hash (or add reference if already stored)
+
+        :param digest: Content hash of data
+        :type digest: str | unicode
+        :param data: Body to store
+        :type data: bytes
+        :rtype: None
+        """
+        ref_key = "ref-" + digest
+        with self._refs_lock:
+            refs = self._cache_meta_get(ref_key) or 0
+            if not refs:
+                self._cache_set(digest, data)
+            self._cache_meta_set(ref_key, refs + 1)
+
+    def _release_body(self, digest):
+        """
+        Remove reference to body (and body if no longer referenced)
+
+        :param digest: Content hash of body
+        :type digest: str | unicode
+        :rtype: None
+        """
+        ref_key = "ref-" + digest
+        with self._refs_lock:
+            refs = (self._cache_meta_get(ref_key) or 0) - 1
+            if refs > 0:
+                self._cache_meta_set(ref_key, refs)
+                return
+            self._cache_delete(ref_key)
+            self._cache_body_delete(digest)
+
+    def _remove(self, key, access_time=None):
+        """
+        Remove entry (and release its body)
+
+        :param key: Key of entry
+        :type key: str | unicode
+        :param access_time: Only remove if entry still has this access time
+            (default: None) None -> always remove
+        :type access_time: None | datetime.datetime
+        :return: Entry was removed
+        :rtype: bool
+        """
+        if self._memory is not None:
+            self._memory.pop(key)
+        meta = self._cache_meta_get(key)
+        if not self._cache_delete(key, access_time):
+            return False
+        if isinstance(meta, dict) and meta.get('digest'):
+            self._release_body(meta['digest'])
+        return True
+
+    def delete(self, url, params=None, headers=None):
+        """
+        Remove url from cache
+
+        :param url: Url to remove
+        :type url: str | unicode
+        :param params: Parameters of request (default: None)
+        :type params: None | dict | list[(str | unicode, object)]
+        :param headers: Headers of request (default: None)
+        :type headers: None | dict | requests.structures.CaseInsensitiveDict
+        :return: Entry was removed
+        :rtype: bool
+        """
+        return self._remove(self._resolve_key(url, params, headers))
+
+    def gc(self, limit=None):
+        """
+        Remove expired entries (older than duration + gc_grace) and
+        least recently accessed entries exceeding max_entries/max_bytes
+
+        :param limit: Remove at most this many entries (default: None)
+            None -> no limit
+        :type limit: None | int
+        :return: Number of removed entries
+        :rtype: int
+        """
+        now = now_utc()
+        entries = []
+        candidates = []
+        total = 0
+        seen = set()
+        """ Bodies already counted (deduplicated bodies only count once) """
+
+        for key, meta in self._cache_meta_items():
+            if not isinstance(meta, (dict, datetime.datetime)):
+                # e.g. version information or body references
+                continue
+            info = self._to_cache_info(meta)
+            if not info.access_time or (
+                self.is_expired(info, now - self.gc_grace)
+            ):
+                candidates.append((key, info.access_time))
+                continue
+            if is_vary_marker(info):
+                # Touched with its variants - not counted for limits
+                continue
+            size = info.size or 0
+            if info.digest:
+                if info.digest in seen:
+                    size = 0
+                seen.add(info.digest)
+            entries.append((info.access_time, key, size))
+            total += size
+
+        if self.max_entries is not None or self.max_bytes is not None:
+            entries.sort()
+            count = len(entries)
+            for access_time, key, size in entries:
+                if (self.max_entries is None or count <= self.max_entries) \
+                        and (self.max_bytes is None or
+                             total <= self.max_bytes):
+                    break
+                candidates.append((key, access_time))
+                count -= 1
+                total -= size
+        if limit is not None:
+            candidates = candidates[:limit]
+        removed = 0
+
+        for key, access_time in candidates:
+            try:
+                if self._remove(key, access_time):
+                    removed += 1
+            except:
+                self.exception("Failed to remove {}".format(key))
+        self.flush()
+        if removed:
+            self.debug("Removed {} cache entries".format(removed))
+        return removed
+
+    def vacuum(self):
+        """
+        Remove all entries due for removal and compact storage
+
+        :rtype: None
+        """
+        self.gc()
+
+    def start_gc(self, interval=60.0, limit=1000):
+        """
+        Run gc periodically in background thread
+
+        :param interval: Seconds between runs (default: 60.0)
+        :type interval: float
+        :param limit: Entries to remove per run (default: 1000)
+        :type limit: None | int
+        :rtype: None
+        """
+        if self._gc_thread and self._gc_thread.is_alive():
+            return
+        self._gc_stop.clear()
+        self._gc_thread = threading.Thread(
+            target=self._gc_loop, args=(interval, limit),
+            name="{}-gc".format(self.__class__.__name__)
+        )
+        self._gc_thread.daemon = True
+        self._gc_thread.start()
+
+    def stop_gc(self, timeout=None):
+        """
+        Stop background gc
+
+        :param timeout: Seconds to wait for thread to end (default: None)
+        :type timeout: None | float
+        :rtype: None
+        """
+        self._gc_stop.set()
+        if self._gc_thread:
+            self._gc_thread.join(timeout)
+            self._gc_thread = None
+
+    def _gc_loop(self, interval, limit):
+        while not self._gc_stop.wait(interval):
+            try:
+                self.gc(limit)
+            except:
+                self.exception("Failed to run gc")
+
+    def flush(self):
+        """
+        Persist pending changes (if any are buffered)
+
+        :rtype: None
+        """
+        pass
+
+    def close(self):
+        """
+        Stop background gc and persist pending changes
+
+        :rtype: None
+        """
+        self.stop_gc()
+        self.flush()
 
 
 class NullCache(Cache):
@@ -204,17 +1257,76 @@ class NullCache(Cache):
     def _cache_meta_set(self, key, val):
         pass
 
-    def get(self, url, ignore_access_time=False):
+    def _cache_meta_items(self):
+        return []
+
+    def _cache_delete(self, key, access_time=None):
+        return False
+
+    def _cache_body_delete(self, key):
+        pass
+
+    def get_response(
+            self, url, ignore_access_time=False, params=None, headers=None
+    ):
         return None, None
 
-    def update(self, url, cache_info=None):
+    def update(self, url, cache_info=None, params=None, headers=None):
         pass
 
-    def put(self, url, html, cache_info=None):
+    def put(
+            self, url, html, cache_info=None, raw=None, encoding=None,
+            params=None, headers=None
+    ):
         pass
 
 
+class _IndexState(object):
+    """ Index shared by all FileCache instances using the same index file """
+
+    def __init__(self):
+        self.index = {}
+        """ Cache entries
+            :type : dict """
+        self.dirty = {}
+        """ Changed entries not yet written to journal (None -> removed)
+            :type : dict """
+        self.loaded = False
+        self.generation = None
+        """ Generation of journal the index is synced with """
+        self.offset = 0
+        """ Bytes of journal already applied """
+        self.entries = 0
+        """ Entries in journal """
+        self.last_flush = time.time()
+        self.last_sync = 0.0
+        self.lock = threading.RLock()
+
+
+_indexes = {}
+""" Index states by index path
+    :type : dict[str | unicode, _IndexState] """
+_indexes_lock = threading.Lock()
+_open_caches = weakref.WeakSet()
+""" FileCache instances to flush at exit
+    :type : weakref.WeakSet[FileCache] """
+
+
+@atexit.register
+def _flush_at_exit():
+    for cache in list(_open_caches):
+        cache.flush()
+
+
 class FileCache(Cache):
+    """
+    Cache saving bodies as files and keeping an index of all entries
+
+    Index changes are appended to a journal and are periodically compacted
+    into the index snapshot, so a put does not rewrite the whole index.
+    Journal changes of other processes are merged into the index on sync;
+    compaction is done under an exclusive lock, appending under a shared one
+    """
 
     def __init__(self, settings=None):
         if settings is None:
@@ -224,83 +1336,743 @@ class FileCache(Cache):
         self._index_path = settings.get(
             'index', os.path.join(self._dir, "cache_index.tmp")
         )
-        self._index = None
-        with _cache_lock:
-            self._index = _cache
+        self._journal_path = settings.get(
+            'journal', self._index_path + ".journal"
+        )
+        self._lock_path = self._index_path + ".lock"
+        self.flush_count = settings.get('flush_count', 1)
+        """ Write journal after this many changed entries (default: 1)
+            :type : int """
+        self.flush_interval = settings.get('flush_interval', None)
+        """ Write journal at least every x seconds (default: None)
+            :type : None | int | float """
+        self.compact_count = settings.get('compact_count', 10000)
+        """ Compact journal into index after this many entries
+            (default: 10000)
+            :type : int """
+        self.sync_interval = settings.get('sync_interval', 1.0)
+        """ Read changes of other processes at most every x seconds
+            (default: 1.0)
+            :type : int | float """
+        self.shard_depth = settings.get('shard_depth', 0)
+        """ Number of sub directory levels for bodies (default: 0 - flat)
+            :type : int """
+        self.shard_width = settings.get('shard_width', 2)
+        """ Characters of key used per sub directory level (default: 2)
+            :type : int """
+        self.dedup_grace = settings.get('dedup_grace', 3600)
+        """ Keep unreferenced deduplicated bodies at least x seconds
+            - entries of other processes might not be in journal yet
+            (default: 3600)
+            :type : int | float """
+        with _indexes_lock:
+            path = os.path.abspath(self._index_path)
+            if path not in _indexes:
+                _indexes[path] = _IndexState()
+            self._state = _indexes[path]
+            _open_caches.add(self)
+        self._index = self._state.index
+
+    @contextlib.contextmanager
+    def _file_lock(self, shared=True):
+        """
+        Lock index across processes
+
+        :param shared: Shared lock (appending/reading) or exclusive lock
+            (compacting) (default: True)
+        :type shared: bool
+        """
+        if not porta:
+            yield
+            return
+        with open(self._lock_path, "a") as f:
+            porta.lock(f, porta.LOCK_SH if shared else porta.LOCK_EX)
+            try:
+                yield
+            finally:
+                porta.unlock(f)
 
     def _init_index(self):
-        if not self._index:
-            if os.path.exists(self._index_path):
-                try:
-                    with open(self._index_path, "r", encoding="utf-8") as f:
-                        if porta:
-                            porta.lock(f, porta.LOCK_EX)
-                        self._index = self._load_json_file(f)
-                except IOError as e:
-                    if str(e) != "Decoding json failed":
-                        self.exception("Failed to load cache file")
-                except:
+        state = self._state
+        if state.loaded and \
+                time.time() - state.last_sync < self.sync_interval:
+            return
+        with state.lock:
+            try:
+                with self._file_lock():
+                    self._sync()
+            except:
+                self.exception("Failed to load cache journal")
+            if not state.loaded:
+                state.loaded = True
+                if not self._index:
+                    self._index['version'] = "1.0"
+            if state.entries >= self.compact_count:
+                self.compact()
+
+    def _load_snapshot(self):
+        """
+        Load index snapshot (local changes not yet saved are kept)
+
+        :rtype: None
+        """
+        state = self._state
+        self._index.clear()
+        if os.path.exists(self._index_path):
+            try:
+                with open(self._index_path, "r", encoding="utf-8") as f:
+                    self._index.update(self._load_json_file(f))
+            except IOError as e:
+                if str(e) != "Decoding json failed":
                     self.exception("Failed to load cache file")
+            except:
+                self.exception("Failed to load cache file")
+        elif not state.loaded:
+            self.warning(
+                "Cache index does not exist ({})".format(self._index_path)
+            )
+        for key, val in state.dirty.items():
+            if val is None:
+                self._index.pop(key, None)
             else:
-                self.warning(
-                    "Cache index does not exist ({})".format(self._index_path)
-                )
+                self._index[key] = val
 
-        if not self._index:
-            self._index = {'version': "1.0"}
+    def _sync(self):
+        """
+        Apply journal changes not yet in index (also from other processes)
+        - needs file lock
+
+        :rtype: None
+        """
+        state = self._state
+        try:
+            with open(self._journal_path, "rb") as f:
+                header = f.readline()
+                generation = _journal_generation(header)
+                size = os.fstat(f.fileno()).st_size
+                if generation != state.generation or not state.loaded \
+                        or size < state.offset:
+                    # Compacted by other process (or first load)
+                    self._load_snapshot()
+                    state.generation = generation
+                    state.offset = len(header) if generation else 0
+                    state.entries = 0
+                f.seek(state.offset)
+                data = f.read()
+        except (IOError, OSError) as e:
+            if e.errno != errno.ENOENT:
+                raise
+            # No journal (yet)
+            if state.generation is not None or not state.loaded:
+                self._load_snapshot()
+            state.generation = None
+            state.offset = 0
+            state.entries = 0
+            data = b""
+        # Ignore incomplete last line (still written or crash)
+        end = data.rfind(b"\n") + 1
+
+        for line in data[:end].splitlines():
+            try:
+                entry = load_json(line.decode("utf-8"))
+            except ValueError:
+                self.warning("Skipping corrupt journal entry")
+                continue
+            key = entry.get('k')
+            if key is None or key in state.dirty:
+                # Header or local change not yet written
+                continue
+            if entry.get('v') is None:
+                self._index.pop(key, None)
+            else:
+                self._index[key] = entry['v']
+            state.entries += 1
+        state.offset += end
+        state.last_sync = time.time()
 
     def _cache_meta_get(self, key):
-        with _cache_lock:
-            _cache.update(self._index)
-            return _cache.get(key, None)
+        with self._state.lock:
+            return self._index.get(key, None)
+
+    def _body_path(self, key):
+        """
+        Get path of body file for key (e.g. ab/cd/abcd...tmp for depth 2)
+
+        :param key: Key of entry
+        :type key: str | unicode
+        :return: Path to body file
+        :rtype: str | unicode
+        """
+        width = self.shard_width
+        parts = [
+            key[i * width:(i + 1) * width] for i in range(self.shard_depth)
+        ]
+        parts.append(key + ".tmp")
+        return os.path.join(self._dir, *parts)
+
+    def migrate_layout(self):
+        """
+        Move bodies saved in flat layout (<directory>/<key>.tmp) into
+        current sharded layout
+
+        :return: Number of moved bodies
+        :rtype: int
+        """
+        if not self.shard_depth:
+            return 0
+        moved = 0
+
+        for name in os.listdir(self._dir):
+            if not _flat_body_reg.match(name):
+                continue
+            key = name[:-len(".tmp")]
+            dst = self._body_path(key)
+            _makedirs(os.path.dirname(dst))
+            try:
+                _replace(os.path.join(self._dir, name), dst)
+            except OSError:
+                self.exception("Failed to move {}".format(name))
+                continue
+            moved += 1
+        self.info("Moved {} cache bodies".format(moved))
+        return moved
 
     def _cache_get(self, key):
-        tmp_path = os.path.join(self._dir, key + ".tmp")
-        with open(tmp_path, "r", encoding="utf-8") as f:
-            if porta:
-                porta.lock(f, porta.LOCK_EX)
+        # Bodies are replaced atomically -> no lock needed
+        with open(self._body_path(key), "rb") as f:
             return f.read()
 
     def _cache_meta_set(self, key, val):
-        self._index[key] = val
-        with _cache_lock:
-            _cache[key] = self._index[key]
+        with self._state.lock:
+            self._index[key] = val
+            self._state.dirty[key] = val
+
+    def _cache_meta_items(self):
+        self._init_index()
+        with self._state.lock:
+            return list(self._index.items())
+
+    def _cache_delete(self, key, access_time=None):
+        with self._state.lock:
+            meta = self._index.get(key)
+            if meta is None:
+                return False
+            if access_time is not None and \
+                    self._to_cache_info(meta).access_time != access_time:
+                # Changed in the meantime
+                return False
+            del self._index[key]
+            self._state.dirty[key] = None
+        self._cache_body_delete(key)
+        return True
+
+    def _cache_body_delete(self, key):
+        try:
+            os.remove(self._body_path(key))
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
 
     def _cache_set(self, key, val):
-        tmp_path = os.path.join(self._dir, key + ".tmp")
-        with open(tmp_path, "w", encoding="utf-8") as f:
-            if porta:
-                porta.lock(f, porta.LOCK_EX)
+        path = self._body_path(key)
+        if self.shard_depth:
+            _makedirs(os.path.dirname(path))
+        # Write to own file and replace -> readers never see partial body
+        tmp_path = "{}.{}-{}".format(
+            path, os.getpid(), threading.current_thread().ident
+        )
+        with open(tmp_path, "wb") as f:
             f.write(val)
-            # Try flushing to make data available sooner
-            # (try to get rid of erroneous reads)
-            f.flush()
+        _replace(tmp_path, path)
+
+    def _acquire_body(self, digest, data):
+        # No reference counts (not mergeable between processes)
+        # - gc removes bodies no longer referenced by the index
+        path = self._body_path(digest)
+        with self._file_lock():
+            try:
+                # Mark as recently used -> not removed by running gc
+                os.utime(path, None)
+                return
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+            self._cache_set(digest, data)
+
+    def _release_body(self, digest):
+        # Removed by gc once no longer referenced
+        pass
+
+    def gc(self, limit=None):
+        removed = super(FileCache, self).gc(limit)
+        if self.dedup:
+            self._remove_unreferenced()
+        return removed
+
+    def _remove_unreferenced(self, batch=1000):
+        """
+        Remove deduplicated bodies no longer referenced by any entry
+        (and older than dedup_grace)
+
+        The cache directory is scanned without holding any lock - candidates
+        are checked again and removed in batches under the lock
+
+        :param batch: Candidates checked and removed at once (default: 1000)
+        :type batch: int
+        :return: Number of removed bodies
+        :rtype: int
+        """
+        state = self._state
+        cutoff = time.time() - self.dedup_grace
+        removed = 0
+
+        try:
+            with state.lock:
+                with self._file_lock(shared=False):
+                    # Index of all processes
+                    self._sync()
+                    referenced = self._index_digests()
+                    for key in list(self._index):
+                        if key.startswith("ref-"):
+                            # Counter of previous versions
+                            del self._index[key]
+                            state.dirty[key] = None
+            candidates = []
+
+            for root, _, names in os.walk(self._dir):
+                for name in names:
+                    if not _digest_body_reg.match(name) \
+                            or name[:-len(".tmp")] in referenced:
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        if os.path.getmtime(path) >= cutoff:
+                            continue
+                    except OSError:
+                        # Removed meanwhile
+                        continue
+                    candidates.append((name[:-len(".tmp")], path))
+                    if len(candidates) >= batch:
+                        removed += self._remove_bodies(candidates, cutoff)
+                        candidates = []
+            if candidates:
+                removed += self._remove_bodies(candidates, cutoff)
+        except:
+            self.exception("Failed to remove unreferenced bodies")
+        self.flush()
+        if removed:
+            self.debug("Removed {} unreferenced bodies".format(removed))
+        return removed
+
+    def _index_digests(self):
+        """
+        Get digests of bodies referenced by entries in index
+
+        :return: Referenced digests
+        :rtype: set[str | unicode]
+        """
+        return set(
+            meta.get('digest') for meta in self._index.values()
+            if isinstance(meta, dict)
+        )
+
+    def _remove_bodies(self, candidates, cutoff):
+        """
+        Remove bodies still unreferenced and not used since cutoff
+
+        :param candidates: Digests and paths of bodies
+        :type candidates: list[(str | unicode, str | unicode)]
+        :param cutoff: Only remove bodies last modified before (timestamp)
+        :type cutoff: float
+        :return: Number of removed bodies
+        :rtype: int
+        """
+        state = self._state
+        removed = 0
+
+        with state.lock:
+            with self._file_lock(shared=False):
+                self._sync()
+                referenced = self._index_digests()
+                for digest, path in candidates:
+                    if digest in referenced:
+                        continue
+                    try:
+                        if os.path.getmtime(path) >= cutoff:
+                            # Reused meanwhile
+                            continue
+                        os.remove(path)
+                    except OSError:
+                        continue
+                    removed += 1
+        return removed
 
-    def get(self, url, ignore_access_time=False):
+    def get_response(
+            self, url, ignore_access_time=False, params=None, headers=None
+    ):
         if not self._dir:
             self.debug("From inet {}".format(url))
-            return None, None, None
+            return None, None
 
         self._init_index()
 
-        return super(FileCache, self).get(url, ignore_access_time)
+        res = super(FileCache, self).get_response(
+            url, ignore_access_time, params, headers
+        )
+        self._flush_due()
+        return res
 
-    def put(self, url, html, cache_info=None):
+    def update(self, url, cache_info=None, params=None, headers=None):
         if not self._dir:
             return
-        super(FileCache, self).put(url, html, cache_info)
+        self._init_index()
+        super(FileCache, self).update(url, cache_info, params, headers)
+        self._flush_due()
 
-        # Better in a close statement?
+    def put(
+            self, url, html, cache_info=None, raw=None, encoding=None,
+            params=None, headers=None
+    ):
+        if not self._dir:
+            return
+        self._init_index()
+        super(FileCache, self).put(
+            url, html, cache_info, raw, encoding, params, headers
+        )
+        self._flush_due()
+
+    def _flush_due(self):
+        """
+        Write journal if enough changes are pending (flush_count) or last
+        write is older than flush_interval
+
+        :rtype: None
+        """
+        state = self._state
+
+        with state.lock:
+            if not state.dirty:
+                return
+            due = len(state.dirty) >= self.flush_count
+            if not due and self.flush_interval is not None:
+                due = time.time() - state.last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """
+        Write pending index changes to journal
+        (and compact journal into index if it got too large)
+
+        :rtype: None
+        """
+        state = self._state
+        with state.lock:
+            if not state.dirty:
+                return
+            data = "".join([
+                save_json({'k': key, 'v': val}) + "\n"
+                for key, val in state.dirty.items()
+            ]).encode("utf-8")
+            try:
+                with self._file_lock():
+                    # Single write with O_APPEND -> not interleaved with
+                    # appends of other processes
+                    fd = os.open(
+                        self._journal_path,
+                        os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                        0o644
+                    )
+                    try:
+                        written = os.write(fd, data)
+                        while written < len(data):
+                            written += os.write(fd, data[written:])
+                    finally:
+                        os.close(fd)
+            except:
+                self.exception("Failed to save cache journal")
+                return
+            state.entries += len(state.dirty)
+            state.dirty.clear()
+            state.last_flush = time.time()
+            if state.entries >= self.compact_count:
+                self.compact()
+
+    def vacuum(self):
+        self.gc()
+        self.compact()
+
+    def compact(self):
+        """
+        Merge journal (of all processes) into index snapshot and start
+        new journal
+
+        :rtype: None
+        """
+        state = self._state
+        with state.lock:
+            try:
+                with self._file_lock(shared=False):
+                    self._sync()
+                    tmp_path = "{}.{}.new".format(
+                        self._index_path, os.getpid()
+                    )
+                    with open(tmp_path, "w", encoding="utf-8") as f:
+                        self._save_json_file(f, self._index)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    _replace(tmp_path, self._index_path)
+                    # Index contains all changes -> new journal
+                    generation = uuid.uuid4().hex
+                    header = (
+                        save_json({'generation': generation}) + "\n"
+                    ).encode("utf-8")
+                    tmp_path = "{}.{}.new".format(
+                        self._journal_path, os.getpid()
+                    )
+                    with open(tmp_path, "wb") as f:
+                        f.write(header)
+                    _replace(tmp_path, self._journal_path)
+            except:
+                self.exception("Failed to save cache")
+                return
+            state.generation = generation
+            state.offset = len(header)
+            state.entries = 0
+
+
+class SqliteCache(Cache):
+    """
+    Cache saving index and bodies in one sqlite database (WAL mode)
+
+    Safe to use from multiple threads and processes
+    """
+
+    def __init__(self, settings=None):
+        if settings is None:
+            settings = {}
+        super(SqliteCache, self).__init__(settings)
+        if sqlite3 is None:
+            raise IOError("sqlite3 not available")
+        self._path = settings.get('path')
+        if not self._path:
+            self._path = os.path.join(settings['directory'], "cache.sqlite")
+        self._timeout = settings.get('timeout', 30.0)
+        self._local = threading.local()
+        """ Connection per thread (sqlite3 connections are not shareable) """
+        directory = os.path.dirname(self._path)
+        if directory:
+            _makedirs(directory)
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY NOT NULL, "
+            "meta TEXT, "
+            "body TEXT, "
+            "access_time TEXT"
+            ")"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS cache_access_time "
+            "ON cache (access_time)"
+        )
+
+    def _connection(self):
+        """
+        Get database connection for current thread
+
+        :return: Connection
+        :rtype: sqlite3.Connection
+        """
+        conn = getattr(self._local, "connection", None)
+        if conn is None:
+            # Autocommit - every statement is its own transaction
+            conn = sqlite3.connect(
+                self._path, timeout=self._timeout, isolation_level=None
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = conn
+        return conn
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """
+        Run statements in one transaction (write lock taken at start)
+
+        :return: Connection
+        :rtype: sqlite3.Connection
+        """
+        conn = self._connection()
+        if getattr(self._local, "in_transaction", False):
+            # Part of outer transaction
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        self._local.in_transaction = True
         try:
-            with open(
-                    self._index_path, "w", encoding="utf-8"
-            ) as f, _cache_lock:
-                if porta:
-                    porta.lock(f, porta.LOCK_EX)
-                self._save_json_file(f, _cache)
-                # try flushing to make data available sooner
-                # (try to get rid of erroneous reads)
-                f.flush()
+            yield conn
         except:
-            self.exception("Failed to save cache")
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+        finally:
+            self._local.in_transaction = False
+
+    def _atomic(self):
+        return self._transaction()
+
+    def _acquire_body(self, digest, data):
+        ref_key = "ref-" + digest
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO cache (key, meta) VALUES (?, '0')",
+                (ref_key,)
+            )
+            conn.execute(
+                "UPDATE cache SET meta = CAST(meta AS INTEGER) + 1 "
+                "WHERE key = ?",
+                (ref_key,)
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO cache (key) VALUES (?)", (digest,)
+            )
+            conn.execute(
+                "UPDATE cache SET body = ? WHERE key = ? AND body IS NULL",
+                (sqlite3.Binary(data), digest)
+            )
+
+    def _release_body(self, digest):
+        ref_key = "ref-" + digest
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE cache SET meta = CAST(meta AS INTEGER) - 1 "
+                "WHERE key = ?",
+                (ref_key,)
+            )
+            row = conn.execute(
+                "SELECT meta FROM cache WHERE key = ?", (ref_key,)
+            ).fetchone()
+            if row and int(row[0]) > 0:
+                return
+            conn.execute("DELETE FROM cache WHERE key = ?", (ref_key,))
+            conn.execute(
+                "DELETE FROM cache WHERE key = ? AND meta IS NULL",
+                (digest,)
+            )
+
+    def _cache_meta_get(self, key):
+        row = self._connection().execute(
+            "SELECT meta FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if not row or row[0] is None:
+            return None
+        return load_json(row[0])
+
+    def _cache_get(self, key):
+        row = self._connection().execute(
+            "SELECT body FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if not row or row[0] is None:
+            raise KeyError(key)
+        body = row[0]
+        if not isinstance(body, bytes) and not hasattr(body, "encode"):
+            # Blob returned as buffer
+            body = bytes(body)
+        return body
+
+    def _cache_meta_set(self, key, val):
+        access_time = None
+        if isinstance(val, dict):
+            access_time = val.get('access_time')
+        if access_time:
+            access_time = access_time.isoformat()
+        self._connection().execute(
+            "INSERT INTO cache (key, meta, access_time) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET "
+            "meta = excluded.meta, access_time = excluded.access_time",
+            (key, save_json(val), access_time)
+        )
+
+    def _cache_set(self, key, val):
+        self._connection().execute(
+            "INSERT INTO cache (key, body) VALUES (?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET body = excluded.body",
+            (key, sqlite3.Binary(val))
+        )
+
+    def _cache_meta_items(self):
+        return [
+            (key, load_json(meta))
+            for key, meta in self._connection().execute(
+                "SELECT key, meta FROM cache WHERE meta IS NOT NULL"
+            ).fetchall()
+        ]
+
+    def _cache_delete(self, key, access_time=None):
+        if access_time is None:
+            cur = self._connection().execute(
+                "DELETE FROM cache WHERE key = ?", (key,)
+            )
+        else:
+            cur = self._connection().execute(
+                "DELETE FROM cache WHERE key = ? AND access_time = ?",
+                (key, access_time.isoformat())
+            )
+        return cur.rowcount > 0
+
+    def _cache_body_delete(self, key):
+        conn = self._connection()
+        conn.execute(
+            "DELETE FROM cache WHERE key = ? AND meta IS NULL", (key,)
+        )
+        # Entry now pointing to a shared body
+        conn.execute("UPDATE cache SET body = NULL WHERE key = ?", (key,))
+
+    def vacuum(self):
+        self.gc()
+        self._connection().execute("VACUUM")
+
+    def clear(self, before=None):
+        """
+        Remove entries from cache
+
+        :param before: Only remove entries accessed before this time
+            (default: None) None -> remove all
+        :type before: None | datetime.datetime
+        :return: Number of removed entries
+        :rtype: int
+        """
+        conn = self._connection()
+        if before is None:
+            if self._memory is not None:
+                self._memory.clear()
+            cur = conn.execute("DELETE FROM cache")
+        elif self.dedup:
+            # Release shared bodies
+            removed = 0
+            for key, meta in self._cache_meta_items():
+                if not isinstance(meta, dict):
+                    continue
+                access_time = meta.get('access_time')
+                if access_time and access_time < before:
+                    removed += self._remove(key, access_time)
+            return removed
+        else:
+            if self._memory is not None:
+                # Removed keys unknown -> drop memory tier
+                self._memory.clear()
+            cur = conn.execute(
+                "DELETE FROM cache WHERE access_time < ?",
+                (before.isoformat(),)
+            )
+        return cur.rowcount
+
 
+cache_backends = {
+    'file': FileCache,
+    'sqlite': SqliteCache,
+    'null': NullCache,
+}
+""" Available cache implementations (settings key: backend) """
@@ -0,0 +1,166 @@
+# -*- coding: UTF-8 -*-
+"""
+Detect encoding of response bodies without statistical detection
+where possible
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+__author__ = "the01"
+__email__ = "jungflor@gmail.com"
+__copyright__ = "Copyright (C) 2026, Florian JUNG"
+__license__ = "MIT"
+__version__ = "0.1.0"
+__date__ = "2026-10-16"
+# Created: 2026-10-16 18:05
+
+import codecs
+import re
+
+
+_boms = [
+    # utf-32 before utf-16 (same start)
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+""" Byte order marks and encoding to decode them with """
+_meta_charset_reg = re.compile(
+    br"""<meta[^>]+?charset\s*=\s*["']?\s*([a-zA-Z0-9_:.\-]+)""",
+    re.IGNORECASE
+)
+_xml_encoding_reg = re.compile(
+    br"""^\s*<\?xml[^>]+?encoding\s*=\s*["']([a-zA-Z0-9_:.\-]+)["']"""
+)
+_header_charset_reg = re.compile(
+    r"""charset\s*=\s*["']?\s*([a-zA-Z0-9_:.\-]+)""", re.IGNORECASE
+)
+sniff_size = 4096
+""" Bytes searched for meta charset """
+_chunk_size = 1024 * 1024
+""" Bytes checked at once when trying utf-8 """
+
+
+def _known(encoding):
+    """
+    Normalize encoding name
+
+    :param encoding: Encoding name
+    :type encoding: None | str | unicode | bytes
+    :return: Name of encoding (None if unknown)
+    :rtype: None | str | unicode
+    """
+    if not encoding:
+        return None
+    if isinstance(encoding, bytes):
+        encoding = encoding.decode("ascii", "ignore")
+    try:
+        return codecs.lookup(encoding).name
+    except LookupError:
+        return None
+
+
+def _bom_encoding(raw):
+    """
+    Get encoding of byte order mark
+
+    :param raw: Body
+    :type raw: bytes
+    :return: Encoding (None if no byte order mark)
+    :rtype: None | str | unicode
+    """
+    for bom, encoding in _boms:
+        if raw.startswith(bom):
+            return encoding
+    return None
+
+
+def charset_from_header(content_type):
+    """
+    Get charset given in Content-Type header
+
+    :param content_type: Content-Type header
+    :type content_type: None | str | unicode
+    :return: Known encoding (None if not given)
+    :rtype: None | str | unicode
+    """
+    if not content_type:
+        return None
+    match = _header_charset_reg.search(content_type)
+    if not match:
+        return None
+    return _known(match.group(1))
+
+
+def sniff_encoding(raw):
+    """
+    Get encoding declared in body (byte order mark, xml declaration or
+    meta charset in the first sniff_size bytes)
+
+    :param raw: Body
+    :type raw: bytes
+    :return: Known encoding (None if not declared)
+    :rtype: None | str | unicode
+    """
+    encoding = _bom_encoding(raw)
+    if encoding:
+        return encoding
+    head = raw[:sniff_size]
+    match = _xml_encoding_reg.search(head) or _meta_charset_reg.search(head)
+    if not match:
+        return None
+    encoding = _known(match.group(1))
+    if encoding in ["utf-16", "utf-16-le", "utf-16-be"]:
+        # Declaration readable as ascii -> can not be utf-16 (html spec)
+        encoding = "utf-8"
+    return encoding
+
+
+def is_utf8(raw):
+    """
+    Check if body is valid utf-8 (without decoding it at once)
+
+    :param raw: Body
+    :type raw: bytes
+    :rtype: bool
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        for start in range(0, len(raw), _chunk_size):
+            decoder.decode(raw[start:start + _chunk_size])
+        decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def detect_encoding(raw, content_type=None, fallback=None):
+    """
+    Detect encoding of body
+
+    Byte order mark, charset of Content-Type, declaration in body,
+    valid utf-8 and only then fallback (e.g. statistical detection)
+
+    :param raw: Body
+    :type raw: bytes
+    :param content_type: Content-Type header (default: None)
+    :type content_type: None | str | unicode
+    :param fallback: Called to detect encoding if nothing else matched
+        (default: None)
+    :type fallback: None | callable
+    :return: Encoding (None if not detected)
+    :rtype: None | str | unicode
+    """
+    encoding = _bom_encoding(raw) or charset_from_header(content_type) \
+        or sniff_encoding(raw)
+    if encoding:
+        return encoding
+    if is_utf8(raw):
+        return "utf-8"
+    if fallback is not None:
+        return fallback()
+    return None
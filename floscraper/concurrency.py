@@ -0,0 +1,255 @@
+# -*- coding: UTF-8 -*-
+"""
+Helpers for concurrent use of the scraper
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+__author__ = "the01"
+__email__ = "jungflor@gmail.com"
+__copyright__ = "Copyright (C) 2026, Florian JUNG"
+__license__ = "MIT"
+__version__ = "0.1.0"
+__date__ = "2026-10-16"
+# Created: 2026-10-16 21:40
+
+import threading
+from collections import deque
+try:
+    import queue
+except ImportError:
+    # Python 2
+    import Queue as queue
+
+
+class _Call(object):
+    """ In flight call """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """ Coalesce concurrent calls with the same key into one call """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        """ Calls in flight
+            :type : dict[str | unicode, _Call] """
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Call func - or wait for result if a call with the same key is
+        already in flight
+
+        :param key: Key of call
+        :type key: str | unicode
+        :param func: Function to call
+        :type func: callable
+        :param args: Arguments for func
+        :param kwargs: Keyword arguments for func
+        :return: (result, shared)
+            shared -> result of call made by other thread
+        :rtype: (object, bool)
+        :raises Exception: Exception raised by func
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func(*args, **kwargs)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+class BoundedDispatcher(object):
+    """
+    Hand out items of a (possibly endless) iterable for processing while
+    limiting the number of running items - overall and per key
+
+    Items are read lazily, only a bounded number is held back
+    """
+
+    def __init__(
+            self, items, max_workers, key=None, key_limit=None, max_held=None
+    ):
+        """
+        Initialize object
+
+        :param items: Items to process
+        :type items: collections.Iterable
+        :param max_workers: Maximum number of running items
+        :type max_workers: int
+        :param key: Function to get key of item (default: None)
+        :type key: None | callable
+        :param key_limit: Maximum number of running items per key
+            (default: None - no limit)
+        :type key_limit: None | int
+        :param max_held: Maximum number of items held back because of
+            key_limit (default: None - 10 * max_workers)
+        :type max_held: None | int
+        """
+        if max_workers < 1:
+            raise ValueError("max_workers needs to be at least 1")
+        self._items = iter(items)
+        self._exhausted = False
+        self.max_workers = max_workers
+        self._key = key
+        self.key_limit = key_limit
+        self.max_held = max_held or 10 * max_workers
+        self.running = 0
+        """ Number of running items """
+        self._running_keys = {}
+        """ Number of running items per key
+            :type : dict[object, int] """
+        self._held = {}
+        """ Held back items per key
+            :type : dict[object, collections.deque] """
+        self._held_count = 0
+
+    @property
+    def finished(self):
+        """
+        All items processed
+
+        :rtype: bool
+        """
+        return self._exhausted and not self.running and not self._held_count
+
+    def _start(self, key, item):
+        self.running += 1
+        self._running_keys[key] = self._running_keys.get(key, 0) + 1
+        return item
+
+    def next_items(self):
+        """
+        Get items to start now
+
+        :return: Items to start
+        :rtype: list
+        """
+        res = []
+
+        while not self._exhausted and self.running < self.max_workers \
+                and self._held_count < self.max_held:
+            try:
+                item = next(self._items)
+            except StopIteration:
+                self._exhausted = True
+                break
+            key = self._key(item) if self._key else None
+            if self.key_limit and \
+                    self._running_keys.get(key, 0) >= self.key_limit:
+                # Wait for running item of same key
+                self._held.setdefault(key, deque()).append(item)
+                self._held_count += 1
+                continue
+            res.append(self._start(key, item))
+        return res
+
+    def done(self, item):
+        """
+        Mark item as processed
+
+        :param item: Processed item
+        :type item: object
+        :return: Items to start now
+        :rtype: list
+        """
+        key = self._key(item) if self._key else None
+        self.running -= 1
+        self._running_keys[key] -= 1
+        if not self._running_keys[key]:
+            del self._running_keys[key]
+        res = []
+        held = self._held.get(key)
+
+        if held:
+            self._held_count -= 1
+            res.append(self._start(key, held.popleft()))
+            if not held:
+                del self._held[key]
+        return res + self.next_items()
+
+
+def imap_unordered(func, items, max_workers, key=None, key_limit=None):
+    """
+    Apply func to items on a thread pool and yield results as they complete
+
+    :param func: Function to apply
+    :type func: callable
+    :param items: Items (read lazily)
+    :type items: collections.Iterable
+    :param max_workers: Number of threads
+    :type max_workers: int
+    :param key: Function to get key of item (default: None)
+    :type key: None | callable
+    :param key_limit: Maximum number of running items per key
+        (default: None - no limit)
+    :type key_limit: None | int
+    :return: (item, result, error) - error is exception raised by func
+    :rtype: collections.Iterable[(object, object, None | Exception)]
+    """
+    dispatcher = BoundedDispatcher(items, max_workers, key, key_limit)
+    tasks = queue.Queue()
+    results = queue.Queue()
+    stop = object()
+
+    def worker():
+        while True:
+            item = tasks.get()
+            if item is stop:
+                return
+            try:
+                results.put((item, func(item), None))
+            except Exception as e:
+                results.put((item, None, e))
+
+    workers = []
+
+    def grow():
+        # One thread per running item (up to max_workers)
+        for i in range(len(workers), dispatcher.running):
+            thread = threading.Thread(
+                target=worker, name="imap-worker-{}".format(i)
+            )
+            thread.daemon = True
+            thread.start()
+            workers.append(thread)
+
+    try:
+        for item in dispatcher.next_items():
+            tasks.put(item)
+        grow()
+
+        while not dispatcher.finished:
+            item, result, error = results.get()
+            for new in dispatcher.done(item):
+                tasks.put(new)
+            grow()
+            yield item, result, error
+    finally:
+        # Running items finish in background
+        for _ in workers:
+            tasks.put(stop)
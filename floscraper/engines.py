@@ -0,0 +1,584 @@
+# -*- coding: UTF-8 -*-
+"""
+Extraction engines - how documents are parsed and scheme trees matched
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+__author__ = "the01"
+__email__ = "jungflor@gmail.com"
+__copyright__ = "Copyright (C) 2026, Florian JUNG"
+__license__ = "MIT"
+__version__ = "0.1.0"
+__date__ = "2026-10-16"
+# Created: 2026-10-16 21:10
+
+import re
+import threading
+
+import bs4
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.builder import HTMLTreeBuilder
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:
+    lxml = None
+    etree = None
+
+
+_text_types = (str, type(""))
+_name_reg = re.compile(r"^[a-zA-Z_][a-zA-Z0-9_.\-]*$")
+""" Names usable in xpath as they are """
+_strain_parsers = ["html.parser", "lxml"]
+""" Parsers supporting parse_only """
+_strain_by_function = tuple(
+    int(part) for part in re.findall(r"\d+", bs4.__version__)[:2]
+) < (4, 13)
+""" bs4 calls strainer function with (name, attrs) while parsing
+    (changed in 4.13) """
+_multi_valued = getattr(
+    HTMLTreeBuilder, "DEFAULT_CDATA_LIST_ATTRIBUTES", None
+) or HTMLTreeBuilder.cdata_list_attributes
+""" Attributes bs4 splits into lists (by tag, * for all tags) """
+
+
+class SoupEngine(object):
+    """ Parse with BeautifulSoup and match with find_all """
+
+    name = "bs4"
+
+    def __init__(self, parse_only=True):
+        """
+        Initialize object
+
+        :param parse_only: Only build parts of document the scheme can
+            match (default: True)
+        :type parse_only: bool
+        """
+        self.parse_only = parse_only
+        """ :type : bool """
+
+    def strainer(self, scheme):
+        """
+        Get strainer keeping only elements the first tree steps of scheme
+        can match (with their subtrees)
+
+        Only safe if every field starts with a recursive tree step and
+        no value is taken from the document itself
+
+        :param scheme: Scheme to apply
+        :type scheme: floscraper.scheme.CompiledScheme
+        :return: Strainer (None if whole document is needed)
+        :rtype: None | bs4.SoupStrainer
+        """
+        tags = []
+
+        for field in scheme.fields:
+            if field.value is not None:
+                # Value of document
+                return None
+            if field.tree is None:
+                # Matches nothing
+                continue
+            if not field.tree:
+                # Matches document
+                return None
+            tag = field.tree[0]
+
+            if not tag.recursive or (tag.name is None and not tag.attrs):
+                return None
+            for match in [tag.name] + list(tag.attrs.values()):
+                if match is not None and not isinstance(match, bool) \
+                        and not isinstance(match, _text_types) \
+                        and not hasattr(match, "search"):
+                    return None
+            tags.append(tag)
+        if not tags:
+            return None
+
+        def keep(name, attrs):
+            for a in tags:
+                if _tag_matches(a, name, attrs or {}):
+                    return True
+            return False
+        return SoupStrainer(keep)
+
+    def parse(self, html, html_parser, scheme=None):
+        """
+        Parse html
+
+        :param html: Html to parse
+        :type html: str | unicode
+        :param html_parser: What html parser to use
+        :type html_parser: str | unicode
+        :param scheme: Scheme that will be applied (default: None)
+        :type scheme: None | floscraper.scheme.CompiledScheme
+        :return: Document
+        :rtype: bs4.BeautifulSoup
+        """
+        strainer = None
+
+        if self.parse_only and _strain_by_function and scheme is not None \
+                and html_parser in _strain_parsers:
+            strainer = self.strainer(scheme)
+        if strainer is not None:
+            try:
+                return BeautifulSoup(html, html_parser, parse_only=strainer)
+            except TypeError:
+                # Strainer not supported by bs4 -> parse everything
+                pass
+        return BeautifulSoup(html, html_parser)
+
+    def supports(self, scheme):
+        """
+        Check if scheme can be applied with this engine
+
+        :param scheme: Scheme to apply
+        :type scheme: floscraper.scheme.CompiledScheme
+        :rtype: bool
+        """
+        return True
+
+    def find(self, ele, tag):
+        """
+        Find elements matching tag below ele
+
+        :param ele: Element to search in
+        :type ele: bs4.element.Tag
+        :param tag: Tag to match
+        :type tag: floscraper.scheme.SchemeTag
+        :return: Matches (None if nothing matched)
+        :rtype: None | list[bs4.element.Tag]
+        """
+        return tag.find(ele)
+
+    def text(self, ele):
+        """
+        Get text of element
+
+        :param ele: Element
+        :type ele: bs4.element.Tag
+        :rtype: str | unicode
+        """
+        return "{}".format(ele.getText())
+
+    def attribute(self, ele, name):
+        """
+        Get attribute of element
+
+        :param ele: Element
+        :type ele: bs4.element.Tag
+        :param name: Attribute name
+        :type name: str | unicode
+        :return: Value (multi-valued attributes joined in one string)
+            or None if not set
+        :rtype: None | str | unicode
+        """
+        if name not in ele.attrs:
+            return None
+        res = ele[name]
+
+        if isinstance(res, list):
+            res = " ".join(res)
+        return res
+
+    def html(self, ele):
+        """
+        Get html of element
+
+        :param ele: Element
+        :type ele: bs4.element.Tag
+        :rtype: str | unicode
+        """
+        return "{}".format(ele)
+
+
+def _is_multi_valued(tag_name, key):
+    """
+    Check if bs4 treats attribute as list
+
+    :param tag_name: Name of tag
+    :type tag_name: str | unicode
+    :param key: Name of attribute
+    :type key: str | unicode
+    :rtype: bool
+    """
+    return key in _multi_valued.get('*', []) \
+        or key in _multi_valued.get(tag_name, [])
+
+
+def _matches(value, match):
+    """
+    Match value like bs4 does for names, attributes and strings
+
+    :param value: Value of element (None if not set)
+    :type value: None | str | unicode
+    :param match: What to match against
+    :type match: None | bool | str | unicode | re.RegexObject
+    :rtype: bool
+    """
+    if match is True:
+        return value is not None
+    if value is None:
+        return not match
+    if match is None or match is False:
+        return False
+    if isinstance(match, _text_types):
+        return value == match
+    return match.search(value) is not None
+
+
+def _attribute_matches(tag_name, value, key, match):
+    """
+    Match attribute like bs4 does
+
+    :param tag_name: Name of tag
+    :type tag_name: str | unicode
+    :param value: Value of attribute (None if not set)
+    :type value: None | str | unicode
+    :param key: Name of attribute
+    :type key: str | unicode
+    :param match: What to match against
+    :type match: None | bool | str | unicode | re.RegexObject
+    :rtype: bool
+    """
+    if value is None or not _is_multi_valued(tag_name, key):
+        return _matches(value, match)
+    values = value.split()
+
+    for val in values:
+        if _matches(val, match):
+            return True
+    return _matches(" ".join(values), match)
+
+
+def _tag_matches(tag, name, attrs):
+    """
+    Check if tag of scheme matches name and attributes (ignoring text)
+
+    :param tag: Tag of scheme
+    :type tag: floscraper.scheme.SchemeTag
+    :param name: Name of tag
+    :type name: str | unicode
+    :param attrs: Attributes as in document (not split)
+    :type attrs: dict
+    :rtype: bool
+    """
+    if tag.name is not None and not _matches(name, tag.name):
+        return False
+    for key, match in tag.attrs.items():
+        if not _attribute_matches(name, attrs.get(key), key, match):
+            return False
+    return True
+
+
+def _string(ele):
+    """
+    Get string of element like bs4 tag.string
+
+    :param ele: Element
+    :type ele: lxml.html.HtmlElement
+    :return: Only string in element (None if not exactly one)
+    :rtype: None | str | unicode
+    """
+    while True:
+        if len(ele) == 0:
+            return ele.text or None
+        if ele.text or len(ele) > 1:
+            return None
+        child = ele[0]
+
+        if child.tail:
+            return None
+        if not isinstance(child.tag, _text_types):
+            # Comment or processing instruction
+            return child.text
+        ele = child
+
+
+class LxmlQuery(object):
+    """ Tag of scheme translated to xpath (and filters xpath can not do) """
+
+    def __init__(self, tag):
+        """
+        Initialize object
+
+        :param tag: Tag to translate
+        :type tag: floscraper.scheme.SchemeTag
+        :raises ValueError: Tag can not be translated
+        """
+        test = "*"
+        predicates = []
+        self.variables = {}
+        """ Values of xpath variables
+            :type : dict[str | unicode, str | unicode] """
+        self.filters = []
+        """ Checks done after xpath
+            :type : list[callable] """
+        name = tag.name
+
+        if isinstance(name, _text_types):
+            if _name_reg.match(name):
+                test = name
+            else:
+                predicates.append("name()=$name")
+                self.variables['name'] = name
+        elif hasattr(name, "search"):
+            self.filters.append(
+                lambda ele: isinstance(ele.tag, _text_types)
+                and name.search(ele.tag) is not None
+            )
+        elif name is not None and name is not True:
+            raise ValueError("Unsupported name {}".format(name))
+
+        for i, (key, match) in enumerate(sorted(tag.attrs.items())):
+            predicates.extend(self._attribute(i, key, match))
+        text = tag.text
+
+        if text:
+            if name is None and not tag.attrs:
+                # bs4 would return strings instead of tags
+                raise ValueError("Text needs name or attributes")
+            if not isinstance(text, _text_types) \
+                    and not hasattr(text, "search") and text is not True:
+                raise ValueError("Unsupported text {}".format(text))
+            self.filters.append(lambda ele: _matches(_string(ele), text))
+        expr = test + "".join("[{}]".format(p) for p in predicates)
+        self.path = (".//" if tag.recursive else "./") + expr
+        """ Xpath from element
+            :type : str | unicode """
+        self.path_document = ("/descendant::" if tag.recursive else "/") \
+            + expr
+        """ Xpath from document
+            :type : str | unicode """
+
+    def _attribute(self, i, key, match):
+        """
+        Translate attribute filter
+
+        :param i: Number of attribute (for variable names)
+        :type i: int
+        :param key: Name of attribute
+        :type key: str | unicode
+        :param match: What to match against
+        :type match: None | bool | str | unicode | re.RegexObject
+        :return: Xpath predicates
+        :rtype: list[str | unicode]
+        :raises ValueError: Filter can not be translated
+        """
+        if not isinstance(key, _text_types) or not _name_reg.match(key):
+            raise ValueError("Unsupported attribute {}".format(key))
+        attr = "@" + key
+        var = "a{}".format(i)
+
+        if match is True:
+            return [attr]
+        if match is None or match is False:
+            return ["not({})".format(attr)]
+        if hasattr(match, "search"):
+            self.filters.append(
+                lambda ele: _attribute_matches(
+                    ele.tag, ele.get(key), key, match
+                )
+            )
+            return [attr]
+        if not isinstance(match, _text_types):
+            raise ValueError("Unsupported attribute value {}".format(match))
+        if key in _multi_valued.get('*', []):
+            if not match:
+                return ["not({0}) or normalize-space({0})=''".format(attr)]
+            self.variables[var] = match
+
+            if len(match.split()) != 1 or match != match.strip():
+                return ["normalize-space({})=${}".format(attr, var)]
+            self.variables[var + "p"] = " {} ".format(match)
+            return [
+                "contains(concat(' ', normalize-space({0}), ' '), ${1}p)"
+                " or normalize-space({0})=${1}".format(attr, var)
+            ]
+        for tag_attrs in _multi_valued.values():
+            if key in tag_attrs:
+                # Only multi-valued for some tags
+                self.filters.append(
+                    lambda ele: _attribute_matches(
+                        ele.tag, ele.get(key), key, match
+                    )
+                )
+                return [attr] if match else []
+        if not match:
+            return ["not({0}) or {0}=''".format(attr)]
+        self.variables[var] = match
+        return ["{}=${}".format(attr, var)]
+
+
+class LxmlEngine(object):
+    """ Parse with lxml.html and match with xpath """
+
+    name = "lxml"
+
+    def __init__(self):
+        """
+        Initialize object
+
+        :raises ImportError: lxml not installed
+        """
+        if lxml is None:
+            raise ImportError("lxml not available")
+        self._local = threading.local()
+        """ Compiled xpaths (per thread) """
+
+    def _xpath(self, path):
+        """
+        Get compiled xpath
+
+        :param path: Xpath
+        :type path: str | unicode
+        :rtype: lxml.etree.XPath
+        """
+        compiled = getattr(self._local, "compiled", None)
+
+        if compiled is None:
+            compiled = self._local.compiled = {}
+        if path not in compiled:
+            compiled[path] = etree.XPath(path)
+        return compiled[path]
+
+    def parse(self, html, html_parser=None, scheme=None):
+        """
+        Parse html
+
+        :param html: Html to parse
+        :type html: str | unicode
+        :param html_parser: Ignored - always lxml.html (default: None)
+        :type html_parser: None | str | unicode
+        :param scheme: Ignored (default: None)
+        :type scheme: None | floscraper.scheme.CompiledScheme
+        :return: Document (None if not parsable)
+        :rtype: None | lxml.etree._ElementTree
+        """
+        try:
+            try:
+                root = lxml.html.document_fromstring(html)
+            except ValueError:
+                # Unicode with encoding declaration
+                root = lxml.html.document_fromstring(
+                    html.encode("utf-8"),
+                    parser=lxml.html.HTMLParser(encoding="utf-8")
+                )
+        except etree.ParserError:
+            # e.g. empty document
+            return None
+        return root.getroottree()
+
+    def _query(self, tag):
+        """
+        Get query of tag
+
+        :param tag: Tag
+        :type tag: floscraper.scheme.SchemeTag
+        :return: Query (None if tag can not be translated)
+        :rtype: None | LxmlQuery
+        """
+        if tag.query is None:
+            try:
+                tag.query = LxmlQuery(tag)
+            except ValueError:
+                tag.query = False
+        return tag.query or None
+
+    def supports(self, scheme):
+        """
+        Check if scheme can be applied with this engine
+
+        :param scheme: Scheme to apply
+        :type scheme: floscraper.scheme.CompiledScheme
+        :rtype: bool
+        """
+        for field in scheme.fields:
+            for tag in field.tree or []:
+                if self._query(tag) is None:
+                    return False
+            if field.children is not None \
+                    and not self.supports(field.children):
+                return False
+        return True
+
+    def find(self, ele, tag):
+        """
+        Find elements matching tag below ele
+
+        :param ele: Element (or document) to search in
+        :type ele: lxml.html.HtmlElement | lxml.etree._ElementTree
+        :param tag: Tag to match
+        :type tag: floscraper.scheme.SchemeTag
+        :return: Matches (None if nothing matched)
+        :rtype: None | list[lxml.html.HtmlElement]
+        """
+        query = self._query(tag)
+
+        if hasattr(ele, "getroot"):
+            path = query.path_document
+        else:
+            path = query.path
+        possibles = self._xpath(path)(ele, **query.variables)
+
+        for check in query.filters:
+            possibles = [a for a in possibles if check(a)]
+        return tag.select(possibles)
+
+    def text(self, ele):
+        """
+        Get text of element
+
+        :param ele: Element (or document)
+        :type ele: lxml.html.HtmlElement | lxml.etree._ElementTree
+        :rtype: str | unicode
+        """
+        if hasattr(ele, "getroot"):
+            ele = ele.getroot()
+        # Serializing as text is done in C (faster than itertext)
+        return etree.tostring(
+            ele, method="text", encoding="unicode", with_tail=False
+        )
+
+    def attribute(self, ele, name):
+        """
+        Get attribute of element
+
+        :param ele: Element (or document)
+        :type ele: lxml.html.HtmlElement | lxml.etree._ElementTree
+        :param name: Attribute name
+        :type name: str | unicode
+        :return: Value (multi-valued attributes normalized like bs4)
+            or None if not set
+        :rtype: None | str | unicode
+        """
+        if hasattr(ele, "getroot"):
+            return None
+        res = ele.get(name)
+
+        if res is not None and _is_multi_valued(ele.tag, name):
+            res = " ".join(res.split())
+        return res
+
+    def html(self, ele):
+        """
+        Get html of element
+
+        :param ele: Element (or document)
+        :type ele: lxml.html.HtmlElement | lxml.etree._ElementTree
+        :rtype: str | unicode
+        """
+        if hasattr(ele, "getroot"):
+            return lxml.html.tostring(ele, encoding="unicode")
+        return lxml.html.tostring(ele, encoding="unicode", with_tail=False)
+
+
+engines = {
+    'bs4': SoupEngine,
+    'lxml': LxmlEngine,
+}
+""" Available extraction engines (settings key: engine) """
@@ -8,11 +8,12 @@ __author__ = "the01"
 __email__ = "jungflor@gmail.com"
 __copyright__ = "Copyright (C) 2017-19, Florian JUNG"
 __license__ = "MIT"
-__version__ = "0.1.2"
-__date__ = "2018-08-04"
+__version__ = "0.2.0"
+__date__ = "2026-10-16"
 # Created: 2017-10-06 23:35
 
 import flotils
+from requests.structures import CaseInsensitiveDict
 
 
 class CacheInfo(flotils.FromToDictBase, flotils.PrintableBase):
@@ -25,8 +26,35 @@ class CacheInfo(flotils.FromToDictBase, flotils.PrintableBase):
         self.access_time = access_time
         """ :type : None | datetime.datetime """
         self.hit = None
-        """ Cache hit
-            :type : None | bool """
+        """ Cache hit ("stale" -> expired entry, refreshed in background)
+            :type : None | bool | str | unicode """
+        self.encoding = None
+        """ Encoding of stored body (None -> utf-8)
+            :type : None | str | unicode """
+        self.codec = None
+        """ Compression of stored body (None -> uncompressed)
+            :type : None | str | unicode """
+        self.vary = None
+        """ Request header names (lowercase) the response varies on
+            :type : None | list[str | unicode] """
+        self.digest = None
+        """ Content hash of stored body (if stored deduplicated)
+            :type : None | str | unicode """
+        self.max_age = None
+        """ Freshness lifetime in seconds (None -> cache duration)
+            :type : None | int """
+        self.size = None
+        """ Size of stored body in bytes
+            :type : None | int """
+        self.status_code = None
+        """ Http status code of stored response
+            :type : None | int """
+        self.headers = None
+        """ Selected headers of stored response
+            :type : None | dict[str | unicode, str | unicode] """
+        self.error = None
+        """ Error of failed request (negative cache entry)
+            :type : None | str | unicode """
 
 
 class Response(flotils.FromToDictBase, flotils.PrintableBase):
@@ -38,13 +66,55 @@ class Response(flotils.FromToDictBase, flotils.PrintableBase):
         """ :type : None | CacheInfo """
         self.raw = raw
         """ Raw, undecoded reponse
-            :type : None | unicode """
-        self.html = html
-        """ Html reponse
+            :type : None | bytes """
+        self._html = html
+        """ Html reponse (None -> decoded from raw on access)
             :type : None | unicode """
         self.scraped = scraped
         """ Scrapped content
             :type : None | list | dict """
+        self.status_code = None
+        """ Http status code
+            :type : None | int """
+        self.headers = None
+        """ Response headers (only selected headers if from cache)
+            :type : None | requests.structures.CaseInsensitiveDict """
+        self.encoding = None
+        """ Encoding used to decode raw
+            :type : None | str | unicode """
+        self.retries = 0
+        """ Number of retries of request
+            :type : int """
+        self.retry_wait = 0.0
+        """ Seconds waited between retries
+            :type : float """
+        self.url = None
+        """ Requested url (set by get_many/scrap_many)
+            :type : None | str | unicode """
+        self.error = None
+        """ Why request failed (set by get_many/scrap_many)
+            :type : None | str | unicode """
+
+    @property
+    def html(self):
+        """
+        Html reponse (decoded from raw on first access)
+
+        :rtype: None | unicode
+        """
+        if self._html is None and self.raw is not None:
+            try:
+                self._html = self.raw.decode(
+                    self.encoding or "utf-8", "replace"
+                )
+            except LookupError:
+                # Unknown encoding
+                self._html = self.raw.decode("utf-8", "replace")
+        return self._html
+
+    @html.setter
+    def html(self, value):
+        self._html = value
 
     def __str__(self):
         return "({}), {}, {}, {}".format(
@@ -59,6 +129,10 @@ class Response(flotils.FromToDictBase, flotils.PrintableBase):
         :rtype: dict
         """
         res = super(Response, self).to_dict()
+        del res['_html']
+        res['html'] = self.html
+        if self.headers is not None:
+            res['headers'] = dict(self.headers)
 
         if self.cache_info:
             res['cache_info'] = self.cache_info.to_dict()
@@ -76,9 +150,18 @@ class Response(flotils.FromToDictBase, flotils.PrintableBase):
         """
         if d is None:
             return None
-        return Response(
+        res = Response(
             d.get('html'),
             CacheInfo.from_dict(d.get('cache_info')),
             d.get('scraped'),
             d.get('raw')
         )
+        res.status_code = d.get('status_code')
+        if d.get('headers') is not None:
+            res.headers = CaseInsensitiveDict(d['headers'])
+        res.encoding = d.get('encoding')
+        res.retries = d.get('retries', 0)
+        res.retry_wait = d.get('retry_wait', 0.0)
+        res.url = d.get('url')
+        res.error = d.get('error')
+        return res
@@ -0,0 +1,113 @@
+# -*- coding: UTF-8 -*-
+"""
+Retry policy for failed requests
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+__author__ = "the01"
+__email__ = "jungflor@gmail.com"
+__copyright__ = "Copyright (C) 2026, Florian JUNG"
+__license__ = "MIT"
+__version__ = "0.1.0"
+__date__ = "2026-10-16"
+# Created: 2026-10-16 17:10
+
+import random
+import time
+
+
+class RetryPolicy(object):
+    """ When and how long to wait before retrying a request """
+
+    def __init__(self, settings=None):
+        """
+        Initialize object
+
+        :param settings: Settings for retries
+            (default: None - do not retry)
+        :type settings: None | dict
+        """
+        if settings is None:
+            settings = {'total': 0}
+        self.total = settings.get('total', 3)
+        """ Maximum number of retries (default: 3)
+            :type : int """
+        self.backoff_factor = settings.get('backoff_factor', 0.5)
+        """ Wait backoff_factor * 2 ** retry seconds (default: 0.5)
+            :type : float """
+        self.backoff_max = settings.get('backoff_max', 30.0)
+        """ Wait at most x seconds (default: 30.0)
+            :type : float """
+        self.jitter = settings.get('jitter', 0.5)
+        """ Randomly shorten wait by up to this fraction (default: 0.5)
+            :type : float """
+        self.status_forcelist = set(settings.get(
+            'status_forcelist', [429, 500, 502, 503, 504]
+        ))
+        """ Retry responses with these status codes
+            :type : set[int] """
+        self.methods = set(method.upper() for method in settings.get(
+            'methods', ["GET", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE"]
+        ))
+        """ Only retry these (idempotent) methods
+            :type : set[str | unicode] """
+        self.deadline = settings.get('deadline', None)
+        """ Do not retry if it would take longer than x seconds since
+            first try (default: None - no deadline)
+            :type : None | float """
+        self.respect_retry_after = settings.get('respect_retry_after', True)
+        """ Wait at least as long as Retry-After asks (default: True)
+            :type : bool """
+
+    def backoff(self, retries):
+        """
+        Get wait time before next try
+
+        :param retries: Number of retries already done
+        :type retries: int
+        :return: Seconds to wait
+        :rtype: float
+        """
+        wait = min(self.backoff_max, self.backoff_factor * (2 ** retries))
+        if self.jitter:
+            wait -= random.uniform(0, self.jitter * wait)
+        return wait
+
+    def wait(
+            self, method, retries, started, status_code=None,
+            retry_after=None
+    ):
+        """
+        Get wait time before retrying request
+
+        :param method: Http method of request
+        :type method: str | unicode
+        :param retries: Number of retries already done
+        :type retries: int
+        :param started: Timestamp of first try
+        :type started: float
+        :param status_code: Status code of response
+            (default: None - connection failed)
+        :type status_code: None | int
+        :param retry_after: Seconds the server asks to wait (default: None)
+        :type retry_after: None | float
+        :return: Seconds to wait (None -> do not retry)
+        :rtype: None | float
+        """
+        if retries >= self.total:
+            return None
+        if method.upper() not in self.methods:
+            return None
+        if status_code is not None \
+                and status_code not in self.status_forcelist:
+            return None
+        wait = self.backoff(retries)
+        if retry_after and self.respect_retry_after:
+            wait = max(wait, retry_after)
+        if self.deadline is not None \
+                and time.time() + wait - started > self.deadline:
+            return None
+        return wait
@@ -0,0 +1,289 @@
+# -*- coding: UTF-8 -*-
+"""
+Scrap schemes compiled once for repeated use
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+__author__ = "the01"
+__email__ = "jungflor@gmail.com"
+__copyright__ = "Copyright (C) 2026, Florian JUNG"
+__license__ = "MIT"
+__version__ = "0.1.0"
+__date__ = "2026-10-16"
+# Created: 2026-10-16 18:40
+
+import hashlib
+import json
+import re
+
+
+def _json_default(value):
+    """
+    Serialize precompiled regexes in schemes (by pattern and flags)
+
+    :param value: Value json can not serialize
+    :type value: object
+    :return: Pattern and flags of regex
+    :rtype: list
+    :raises TypeError: Not a regex
+    """
+    if hasattr(value, "pattern"):
+        return [value.pattern, getattr(value, "flags", 0)]
+    raise TypeError("Can not serialize {}".format(type(value)))
+
+
+def digest(value):
+    """
+    Get stable hash of json serializable value (e.g. scheme or settings)
+
+    :param value: Value to hash
+    :type value: object
+    :return: Hash (None if value can not be serialized)
+    :rtype: None | str | unicode
+    """
+    try:
+        data = json.dumps(value, sort_keys=True, default=_json_default)
+    except (TypeError, ValueError):
+        return None
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+
+def _compile(value):
+    """
+    Compile regex definition ({"type": "reg", "reg": ...})
+
+    :param value: Value from scheme
+    :type value: object
+    :return: Compiled regex or value
+    :rtype: object
+    """
+    if isinstance(value, dict) and value.get('type', None) == "reg":
+        return re.compile(value['reg'])
+    return value
+
+
+def _parse_index(index):
+    """
+    Parse index expression ("[]" of tag) - e.g. 0, "-1", "1:", "::2"
+
+    :param index: Index expression
+    :type index: None | int | str | unicode
+    :return: Index or slice
+    :rtype: None | int | slice
+    :raises ValueError: Invalid index expression
+    """
+    if index is None or isinstance(index, int):
+        return index
+    index = "{}".format(index).strip()
+    if ":" not in index:
+        return int(index)
+    parts = index.split(":")
+    if len(parts) > 3:
+        raise ValueError("Invalid slice {}".format(index))
+    return slice(*[int(part) if part.strip() else None for part in parts])
+
+
+class SchemeTag(object):
+    """ Tag of a tree (arguments for find_all) """
+
+    def __init__(self, tag):
+        """
+        Initialize object
+
+        :param tag: Tag definition
+        :type tag: dict
+        :raises ValueError: Invalid definition
+        """
+        if not isinstance(tag, dict):
+            raise ValueError("Tag needs to be a dict")
+        attrs = dict((key, _compile(val)) for key, val in tag.items())
+        self.name = attrs.pop('name', None)
+        """ :type : None | str | unicode | re.RegexObject """
+        self.text = attrs.pop('text', None)
+        """ :type : None | str | unicode | re.RegexObject """
+        self.recursive = attrs.pop('recursive', True)
+        """ :type : bool """
+        self.index = _parse_index(attrs.pop('[]', None))
+        """ Which matches to use
+            :type : None | int | slice """
+        self.attrs = attrs
+        """ Attribute filters
+            :type : dict """
+        self.query = None
+        """ Query of lxml engine (built on first use, False if the tag
+            can not be expressed as query)
+            :type : None | bool | floscraper.engines.LxmlQuery """
+
+    def select(self, possibles):
+        """
+        Keep matches selected by index
+
+        :param possibles: All matches
+        :type possibles: list
+        :return: Selected matches (None if nothing selected)
+        :rtype: None | list
+        """
+        if not possibles:
+            return None
+        if self.index is not None:
+            try:
+                possibles = possibles[self.index]
+            except IndexError:
+                return None
+            if not isinstance(possibles, list):
+                possibles = [possibles]
+        return possibles
+
+    def find(self, ele):
+        """
+        Find matching elements below ele
+
+        :param ele: Element to search in
+        :type ele: bs4.element.Tag
+        :return: Matches (None if nothing matched)
+        :rtype: None | list[bs4.element.Tag]
+        """
+        possibles = ele.find_all(
+            self.name,
+            text=self.text,
+            attrs=self.attrs,
+            recursive=self.recursive
+        )
+        return self.select(possibles)
+
+
+def match_tree(ele, tree, pos=0, find=None):
+    """
+    Get elements matching tree below ele
+
+    :param ele: Element to search in
+    :type ele: bs4.element.Tag
+    :param tree: Tags to match one below the other
+    :type tree: list[SchemeTag]
+    :param pos: Tag of tree to match (default: 0)
+    :type pos: int
+    :param find: Find matches of tag below element - find(ele, tag)
+        (default: None - SchemeTag.find)
+    :type find: None | callable
+    :return: Matches (None if nothing matched)
+    :rtype: None | list[bs4.element.Tag]
+    """
+    if pos >= len(tree):
+        return [ele]
+    if find is None:
+        possibles = tree[pos].find(ele)
+    else:
+        possibles = find(ele, tree[pos])
+    if not possibles:
+        return None
+    res = []
+
+    for a in possibles:
+        match = match_tree(a, tree, pos + 1, find)
+
+        if match:
+            res.extend(match)
+    return res or None
+
+
+class SchemeValue(object):
+    """ How to get a value from elements """
+
+    def __init__(self, value):
+        """
+        Initialize object
+
+        :param value: Value definition
+        :type value: dict
+        """
+        self.type = value.get('type', None)
+        """ text, content, attribute, html or None (html2text)
+            :type : None | str | unicode """
+        self.attribute = value.get('attribute', None)
+        """ Attribute to get (type attribute)
+            :type : None | str | unicode """
+        self.strip = value.get('strip', False)
+        """ :type : bool """
+        reg = value.get('reg', None)
+        if reg is not None and not hasattr(reg, "findall"):
+            reg = re.compile(reg['reg'] if isinstance(reg, dict) else reg)
+        self.reg = reg
+        """ Only keep matches of regex
+            :type : None | re.RegexObject """
+
+
+class SchemeField(object):
+    """ Field of scheme """
+
+    def __init__(self, key, entity):
+        """
+        Initialize object
+
+        :param key: Name of field
+        :type key: str | unicode
+        :param entity: Field definition
+        :type entity: dict
+        :raises ValueError: Invalid definition
+        """
+        if not isinstance(entity, dict):
+            raise ValueError("Field {} needs to be a dict".format(key))
+        self.key = key
+        """ :type : str | unicode """
+        self.tree = None
+        """ Tags to match (None -> no tree given)
+            :type : None | list[SchemeTag] """
+        if "tree" in entity:
+            self.tree = [SchemeTag(tag) for tag in entity['tree'] or []]
+        self.value = None
+        """ Value definition (only for key value)
+            :type : None | SchemeValue """
+        if key == "value":
+            self.value = SchemeValue(entity)
+        self.children = None
+        """ :type : None | CompiledScheme """
+        if "children" in entity:
+            self.children = CompiledScheme(entity['children'])
+
+
+class CompiledScheme(object):
+    """
+    Scheme prepared for extraction (regexes compiled, index expressions
+    parsed) - the original scheme is not changed
+    """
+
+    def __init__(self, scheme):
+        """
+        Initialize object
+
+        :param scheme: Scheme to compile
+        :type scheme: dict
+        :raises ValueError: Invalid scheme
+        """
+        if not isinstance(scheme, dict):
+            raise ValueError("Scheme needs to be a dict")
+        self.scheme = scheme
+        """ Original scheme
+            :type : dict """
+        self.fields = [
+            SchemeField(key, entity) for key, entity in scheme.items()
+        ]
+        """ :type : list[SchemeField] """
+        self._digest = False
+
+    @property
+    def digest(self):
+        """
+        Hash of original scheme (computed on first access)
+
+        :return: Hash (None if scheme can not be serialized)
+        :rtype: None | str | unicode
+        """
+        if self._digest is False:
+            self._digest = digest(self.scheme)
+        return self._digest
+
+    def __len__(self):
+        return len(self.fields)
@@ -0,0 +1,201 @@
+# -*- coding: UTF-8 -*-
+"""
+Per host rate limiting
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+__author__ = "the01"
+__email__ = "jungflor@gmail.com"
+__copyright__ = "Copyright (C) 2026, Florian JUNG"
+__license__ = "MIT"
+__version__ = "0.1.0"
+__date__ = "2026-10-16"
+# Created: 2026-10-16 16:25
+
+import threading
+import time
+
+from .cache import parse_http_date
+
+
+def parse_retry_after(value, now=None):
+    """
+    Parse Retry-After header
+
+    :param value: Header value (seconds or http date)
+    :type value: None | str | unicode
+    :param now: Current timestamp (default: None - time.time())
+    :type now: None | float
+    :return: Seconds to wait or None if invalid
+    :rtype: None | float
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    timestamp = parse_http_date(value)
+    if timestamp is None:
+        return None
+    if now is None:
+        now = time.time()
+    return max(0.0, timestamp - now)
+
+
+class TokenBucket(object):
+    """ Token bucket - rate tokens per second, up to burst tokens """
+
+    def __init__(self, rate, burst=1):
+        """
+        Initialize object
+
+        :param rate: Tokens added per second
+        :type rate: float
+        :param burst: Maximum number of tokens (default: 1)
+        :type burst: int | float
+        """
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = self.burst
+        self.last = None
+
+    def reserve(self, now):
+        """
+        Take one token (may be taken in advance)
+
+        :param now: Current timestamp
+        :type now: float
+        :return: Seconds to wait until token is available
+        :rtype: float
+        """
+        if self.last is not None:
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.last) * self.rate
+            )
+        self.last = now
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+
+class HostScheduler(object):
+    """
+    Decide how long a request to a host has to wait
+
+    Every host has its own token bucket - waiting for one host does not
+    delay requests to other hosts
+    """
+
+    def __init__(
+            self, rate=None, burst=1, host_rates=None, crawl_delay=None,
+            max_retry_after=60.0
+    ):
+        """
+        Initialize object
+
+        :param rate: Requests per second per host
+            (default: None - no limit)
+        :type rate: None | float
+        :param burst: Requests allowed at once (default: 1)
+        :type burst: int
+        :param host_rates: Requests per second for specific hosts
+            (default: None)
+        :type host_rates: None | dict[str | unicode, float]
+        :param crawl_delay: Seconds between requests to a host
+            - for all hosts or by host (default: None)
+        :type crawl_delay: None | float | dict[str | unicode, float]
+        :param max_retry_after: Wait at most x seconds for Retry-After
+            (default: 60.0)
+        :type max_retry_after: float
+        """
+        self.rate = rate
+        self.burst = burst
+        self.host_rates = dict(
+            (host.lower(), val) for host, val in (host_rates or {}).items()
+        )
+        if isinstance(crawl_delay, dict):
+            self.crawl_delay = None
+            self.host_crawl_delays = dict(
+                (host.lower(), val) for host, val in crawl_delay.items()
+            )
+        else:
+            self.crawl_delay = crawl_delay
+            self.host_crawl_delays = {}
+        self.max_retry_after = max_retry_after
+        self._lock = threading.Lock()
+        self._buckets = {}
+        """ :type : dict[str | unicode, None | TokenBucket] """
+        self._not_before = {}
+        """ Hosts asking to wait (Retry-After) until timestamp
+            :type : dict[str | unicode, float] """
+
+    def _host_rate(self, host):
+        """
+        Get requests per second for host
+
+        :param host: Host
+        :type host: str | unicode
+        :return: Rate (None -> no limit)
+        :rtype: None | float
+        """
+        rate = self.host_rates.get(host, self.rate)
+        delay = self.host_crawl_delays.get(host, self.crawl_delay)
+        if delay:
+            if rate is None or 1.0 / delay < rate:
+                rate = 1.0 / delay
+        return rate
+
+    def reserve(self, host):
+        """
+        Reserve request to host
+
+        :param host: Host to request (lowercase)
+        :type host: str | unicode
+        :return: Seconds to wait before request
+        :rtype: float
+        """
+        now = time.time()
+        with self._lock:
+            if host not in self._buckets:
+                rate = self._host_rate(host)
+                bucket = None
+                if rate:
+                    burst = self.burst
+                    if host in self.host_crawl_delays or self.crawl_delay:
+                        burst = 1
+                    bucket = TokenBucket(rate, burst)
+                self._buckets[host] = bucket
+            bucket = self._buckets[host]
+            wait = 0.0
+            not_before = self._not_before.get(host)
+            if not_before is not None:
+                if not_before <= now:
+                    del self._not_before[host]
+                else:
+                    wait = not_before - now
+            if bucket:
+                wait = max(wait, bucket.reserve(now))
+            return wait
+
+    def defer(self, host, seconds):
+        """
+        Do not request host for some time (e.g. Retry-After)
+
+        :param host: Host (lowercase)
+        :type host: str | unicode
+        :param seconds: Seconds to wait (capped at max_retry_after)
+        :type seconds: float
+        :rtype: None
+        """
+        seconds = min(seconds, self.max_retry_after)
+        if seconds <= 0:
+            return
+        until = time.time() + seconds
+        with self._lock:
+            self._not_before[host] = max(
+                until, self._not_before.get(host, 0.0)
+            )
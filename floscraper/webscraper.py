@@ -11,24 +11,50 @@ __author__ = "the01"
 __email__ = "jungflor@gmail.com"
 __copyright__ = "Copyright (C) 2014-19, Florian JUNG"
 __license__ = "MIT"
-__version__ = "0.1.11"
-__date__ = "2019-08-04"
+__version__ = "0.2.0"
+__date__ = "2026-10-16"
 # Created: 2014-04-02 11:23
 
+import copy
+import datetime
+import hashlib
+import json
+import os
 import re
 import socket
+import threading
+import time
+try:
+    import queue
+except ImportError:
+    # Python 2
+    import Queue as queue
+try:
+    from urllib.parse import urlsplit
+except ImportError:
+    # Python 2
+    from urlparse import urlsplit
 
-from bs4 import BeautifulSoup
 import html2text
 import requests
+import requests.adapters
 from requests import HTTPError
-from requests.exceptions import SSLError, Timeout, ConnectionError
+from requests.exceptions import SSLError, Timeout, ConnectionError, \
+    RequestException
+from requests.structures import CaseInsensitiveDict
 
 from flotils.loadable import Loadable
 
 from .default_user_agents import default_user_agents
 from .models import Response, CacheInfo
-from .cache import FileCache, NullCache
+from .cache import NullCache, cache_backends, now_utc, canonical_url, \
+    parse_vary
+from .concurrency import SingleFlight, imap_unordered
+from .throttle import HostScheduler, parse_retry_after
+from .retry import RetryPolicy
+from .charset import detect_encoding
+from .scheme import CompiledScheme, SchemeValue, match_tree, digest
+from .engines import SoupEngine, engines
 
 
 class WEBParameterException(Exception):
@@ -46,6 +72,18 @@ class WEBConnectException(Exception):
     pass
 
 
+def _host(url):
+    """
+    Get host of url (used for per host limits)
+
+    :param url: Url
+    :type url: str | unicode
+    :return: Host (lowercase)
+    :rtype: str | unicode
+    """
+    return (urlsplit(url).hostname or "").lower()
+
+
 class WebScraper(Loadable):
     """ Class for cached, session get/post/.. with optional scraping """
 
@@ -63,21 +101,91 @@ class WebScraper(Loadable):
 
         self.url = settings.get('url', None)
         self.scheme = settings.get('scheme', None)
+        """ Default scheme
+            :type : None | dict | floscraper.scheme.CompiledScheme """
+        self._compiled_scheme = None
+        """ Digest of default scheme and its compiled form
+            :type : None | (None | str | unicode,
+                floscraper.scheme.CompiledScheme) """
+        # Fail early on invalid scheme
+        self._default_scheme()
         self.timeout = settings.get('timeout', None)
 
+        self.stale_while_revalidate = settings.get(
+            'stale_while_revalidate', None
+        )
+        """ Return expired cache entries (up to x seconds after expiry) and
+            refresh them in background (default: None - disabled)
+            :type : None | int | float """
+        self._stale_workers = settings.get('stale_workers', 1)
+        self.error_ttl = settings.get('error_ttl', None)
+        """ Cache error responses (4xx/5xx) for x seconds
+            (default: None - disabled)
+            :type : None | int | float """
+        self.connect_error_ttl = settings.get('connect_error_ttl', None)
+        """ Cache connection failures (e.g. timeouts) for x seconds
+            (default: None - disabled)
+            :type : None | int | float """
+        self._revalidate_queue = queue.Queue()
+        self._revalidate_lock = threading.Lock()
+        self._revalidating = set()
+        """ Requests (see _flight_key) currently queued for revalidation """
+        self._revalidate_workers = []
+        self._flight = SingleFlight()
+        """ Coalesces concurrent fetches of the same url """
+
         cache_sett = settings.get('cache')
         self.cache = NullCache()
         """ :type : None | floscraper.cache.Cache """
         if cache_sett:
-            self.cache = FileCache(cache_sett)
+            backend = cache_sett.get('backend', "file")
+            if backend not in cache_backends:
+                raise WEBParameterException(
+                    "Unknown cache backend {}".format(backend)
+                )
+            self.cache = cache_backends[backend](cache_sett)
 
         self._auth_method = settings.get('auth_method', None)
         self._auth_username = settings.get('auth_username', None)
         self._auth_password = settings.get('auth_password', None)
 
+        self.pool_connections = settings.get('pool_connections', 10)
+        """ Number of hosts to keep connection pools for (default: 10)
+            :type : int """
+        self.pool_maxsize = settings.get('pool_maxsize', 10)
+        """ Connections kept per host (default: 10)
+            :type : int """
+        self.pool_block = settings.get('pool_block', False)
+        """ Wait for free connection instead of opening one that is not kept
+            (default: False)
+            :type : bool """
+        self.keep_alive = settings.get('keep_alive', True)
+        """ Reuse connections (default: True)
+            :type : bool """
+        self.max_body_size = settings.get('max_body_size', None)
+        """ Fail requests with bodies larger than x bytes - bodies are
+            streamed if set (default: None - no limit)
+            :type : None | int """
+        self.chunk_size = settings.get('chunk_size', 64 * 1024)
+        """ Bytes read at once when streaming (default: 64 KiB)
+            :type : int """
+        self._scheduler = HostScheduler(
+            rate=settings.get('rate_limit'),
+            burst=settings.get('rate_burst', 1),
+            host_rates=settings.get('host_rate_limits'),
+            crawl_delay=settings.get('crawl_delay'),
+            max_retry_after=settings.get('max_retry_after', 60.0)
+        )
+        """ Per host rate limits """
+        self._retry = RetryPolicy(settings.get('retry'))
+        """ Retries of failed requests """
+        self._thread_local_session = settings.get(
+            'thread_local_session', False
+        )
+        self._local = threading.local()
+        self._session_lock = threading.Lock()
+        self._session = None
         self.session = None
-        """ Object to do http actions
-            :type _br: requests.Session """
         self._handle_redirect = settings.get('handle_redirect', True)
 
         agent_browser = default_user_agents['browser']['keith']
@@ -102,11 +210,48 @@ class WebScraper(Loadable):
         self._text_maker = None
         """ Object to translate html to markdown (html2text)
             :type : None | html2text.HTML2Text """
+        self._text_maker_settings = None
+        """ Settings of _text_maker
+            :type : None | dict """
         if settings.get('html2text'):
             self._set_html2text(settings['html2text'])
         self.html_parser = settings.get('html_parser', "html.parser")
         """ What html parser to use (default: html.parser - built in)
             :type : str | unicode """
+        engine = settings.get('engine', "bs4")
+        if engine not in engines:
+            raise WEBParameterException(
+                "Unknown engine {}".format(engine)
+            )
+        self._soup_engine = SoupEngine(settings.get('parse_only', True))
+        """ :type : floscraper.engines.SoupEngine """
+        self.engine = self._soup_engine if engine == SoupEngine.name \
+            else engines[engine]()
+        """ Extraction engine (default: bs4)
+            :type : floscraper.engines.SoupEngine
+                | floscraper.engines.LxmlEngine """
+        self.scraped_cache_ttl = settings.get('scraped_cache_ttl', None)
+        """ Cache scraped results for x seconds - keyed by body, scheme
+            and parser (default: None - disabled)
+            :type : None | int """
+
+    @property
+    def session(self):
+        """
+        Object to do http actions (one per thread if thread_local_session)
+
+        :rtype: None | requests.Session
+        """
+        if self._thread_local_session:
+            return getattr(self._local, "session", None)
+        return self._session
+
+    @session.setter
+    def session(self, value):
+        if self._thread_local_session:
+            self._local.session = value
+        else:
+            self._session = value
 
     def _browser_init(self):
         """
@@ -114,19 +259,30 @@ class WebScraper(Loadable):
 
         :rtype: None
         """
-        if self.session:
-            return
-
-        self.session = requests.Session()
-        headers = {}
+        with self._session_lock:
+            if self.session:
+                return
+
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=self.pool_connections,
+                pool_maxsize=self.pool_maxsize,
+                pool_block=self.pool_block
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            headers = {}
 
-        if self.user_agent:
-            headers['User-agent'] = self.user_agent
-        self.session.headers.update(headers)
+            if self.user_agent:
+                headers['User-agent'] = self.user_agent
+            if not self.keep_alive:
+                headers['Connection'] = "close"
+            session.headers.update(headers)
 
-        if self._auth_method in [None, "", "HTTPBasicAuth"]:
-            if self._auth_username is not None:
-                self.session.auth = (self._auth_username, self._auth_password)
+            if self._auth_method in [None, "", "HTTPBasicAuth"]:
+                if self._auth_username is not None:
+                    session.auth = (self._auth_username, self._auth_password)
+            self.session = session
 
     def _set_html2text(self, settings):
         """
@@ -140,6 +296,7 @@ class WebScraper(Loadable):
         :rtype: None
         """
         self._text_maker = html2text.HTML2Text()
+        self._text_maker_settings = dict(settings)
         for param in settings:
             if not hasattr(self._text_maker, param):
                 raise WEBParameterException(
@@ -176,6 +333,7 @@ class WebScraper(Loadable):
                 "Unsupported version {}".format(version)
             )
         self.scheme = conf['scheme']
+        self._default_scheme()
         self.url = conf['url']
         self.timeout = conf.get('timeout', self.timeout)
         if conf.get('html2text'):
@@ -183,11 +341,13 @@ class WebScraper(Loadable):
 
     def request(
             self, method, url, timeout=None,
-            headers=None, data=None, params=None
+            headers=None, data=None, params=None, sink=None
     ):
         """
         Make a request using the requests library
 
+        The body is streamed if max_body_size or sink is set
+
         :param method: Which http method to use (GET/POST)
         :type method: str | unicode
         :param url: Url to make request to
@@ -203,6 +363,9 @@ class WebScraper(Loadable):
         :param params: Parameters to be passed along (e.g. with url in GET)
             (default: None)
         :type params: None | dict
+        :param sink: Write body of successful response to this file
+            instead of keeping it in memory (default: None)
+        :type sink: None | file
         :return: Response to the request
         :rtype: requests.Response
         :raises WEBConnectException: Loading failed
@@ -211,31 +374,187 @@ class WebScraper(Loadable):
             headers = {}
         if not self.session:
             self._browser_init()
+        stream = self.max_body_size is not None or sink is not None
+        retries = 0
+        retry_wait = 0.0
+        started = time.time()
+
+        while True:
+            wait = self._throttle_wait(url)
+            if wait > 0:
+                time.sleep(wait)
+            response = error = None
+            try:
+                response = self.session.request(
+                    method,
+                    url,
+                    timeout=timeout,
+                    allow_redirects=self._handle_redirect,
+                    headers=headers,
+                    data=data,
+                    params=params,
+                    stream=stream
+                )
+            except SSLError as e:
+                raise WEBConnectException(e)
+            except HTTPError:
+                raise WEBConnectException("Unable to load {}".format(url))
+            except (Timeout, socket.timeout):
+                error = WEBConnectException("Timeout loading {}".format(url))
+            except ConnectionError:
+                error = WEBConnectException("Failed to load {}".format(url))
+            except Exception:
+                self.exception("Failed to load {}".format(url))
+                raise WEBConnectException(
+                    "Unknown failure loading {}".format(url)
+                )
+            wait = self._retry_wait(
+                method, url, retries, started, response, error
+            )
+            if wait is None:
+                break
+            if response is not None:
+                # Release connection
+                response.close()
+            retries += 1
+            retry_wait += wait
+            time.sleep(wait)
+        if error is not None:
+            raise error
+        if stream:
+            self._read_body(url, response, sink if response.ok else None)
+        response.retries = retries
+        response.retry_wait = retry_wait
+        return response
+
+    def _check_body_size(self, url, size):
+        """
+        Fail if body is larger than max_body_size
 
+        :param url: Requested url
+        :type url: str | unicode
+        :param size: Size of body in bytes (e.g. Content-Length)
+        :type size: None | int | str | unicode
+        :rtype: None
+        :raises WEBConnectException: Body too large
+        """
+        if self.max_body_size is None or size is None:
+            return
         try:
-            response = self.session.request(
-                method,
-                url,
-                timeout=timeout,
-                allow_redirects=self._handle_redirect,
-                headers=headers,
-                data=data,
-                params=params
+            size = int(size)
+        except ValueError:
+            return
+        if size > self.max_body_size:
+            raise WEBConnectException(
+                "Response too large ({} > {} bytes) {}".format(
+                    size, self.max_body_size, url
+                )
             )
-        except SSLError as e:
-            raise WEBConnectException(e)
-        except HTTPError:
-            raise WEBConnectException("Unable to load {}".format(url))
-        except (Timeout, socket.timeout):
-            raise WEBConnectException("Timeout loading {}".format(url))
-        except ConnectionError:
-            raise WEBConnectException("Failed to load {}".format(url))
+
+    def _read_body(self, url, response, sink=None):
+        """
+        Read streamed body (into memory or sink)
+
+        :param url: Requested url
+        :type url: str | unicode
+        :param response: Streamed response
+        :type response: requests.Response
+        :param sink: Write body to this file (default: None - into memory)
+        :type sink: None | file
+        :rtype: None
+        :raises WEBConnectException: Body too large or loading failed
+        """
+        chunks = []
+        size = 0
+
+        try:
+            self._check_body_size(url, response.headers.get('Content-Length'))
+            for chunk in response.iter_content(self.chunk_size):
+                size += len(chunk)
+                self._check_body_size(url, size)
+                if sink is None:
+                    chunks.append(chunk)
+                else:
+                    sink.write(chunk)
+        except WEBConnectException:
+            raise
         except Exception:
-            self.exception("Failed to load {}".format(url))
-            raise WEBConnectException(
-                "Unknown failure loading {}".format(url)
+            raise WEBConnectException("Unable to load {}".format(url))
+        finally:
+            response.close()
+        response._content = b"".join(chunks) if sink is None else None
+        response._content_consumed = True
+
+    def _retry_wait(self, method, url, retries, started, response, error):
+        """
+        Get wait time before retrying request
+
+        :param method: Http method of request
+        :type method: str | unicode
+        :param url: Requested url
+        :type url: str | unicode
+        :param retries: Number of retries already done
+        :type retries: int
+        :param started: Timestamp of first try
+        :type started: float
+        :param response: Response of request (None if failed)
+        :type response: None | requests.Response
+        :param error: Why request failed
+        :type error: None | WEBConnectException
+        :return: Seconds to wait (None -> do not retry)
+        :rtype: None | float
+        """
+        if response is None:
+            wait = self._retry.wait(method, retries, started)
+        else:
+            retry_after = self._check_retry_after(url, response)
+            wait = self._retry.wait(
+                method, retries, started, response.status_code, retry_after
             )
-        return response
+        if wait is not None:
+            self.info("Retry {} of {} in {:.2f}s ({})".format(
+                retries + 1, url, wait,
+                error if response is None else response.status_code
+            ))
+        return wait
+
+    def _throttle_wait(self, url):
+        """
+        Reserve request to host of url
+
+        :param url: Url to request
+        :type url: str | unicode
+        :return: Seconds to wait before request
+        :rtype: float
+        """
+        host = _host(url)
+        wait = self._scheduler.reserve(host)
+        if wait > 0:
+            self.debug("Waiting {:.2f}s for {}".format(wait, host))
+        return wait
+
+    def _check_retry_after(self, url, response):
+        """
+        Do not request host for a while if response asks for it
+
+        :param url: Requested url
+        :type url: str | unicode
+        :param response: Response of request
+        :type response: requests.Response
+        :return: Seconds the host asks to wait (at most max_retry_after)
+        :rtype: None | float
+        """
+        if response.status_code not in [
+            requests.codes.TOO_MANY_REQUESTS,
+            requests.codes.SERVICE_UNAVAILABLE
+        ]:
+            return None
+        wait = parse_retry_after(response.headers.get('Retry-After'))
+        if wait:
+            self.info("{} asks to retry after {}s".format(_host(url), wait))
+            self._scheduler.defer(_host(url), wait)
+            wait = min(wait, self._scheduler.max_retry_after)
+        return wait
 
     def _get(self, url, **kwargs):
         """
@@ -284,10 +603,75 @@ class WebScraper(Loadable):
         """
         if headers is None:
             headers = {}
+        cached, cache_info, stale = self._get_cached(
+            url, headers, params, cache_ext
+        )
+        if cached:
+            if stale:
+                self._revalidate(
+                    url, timeout, headers, params, cache_info.clone()
+                )
+            return cached
+        # Not using cached
+        res, shared = self._flight.do(
+            self._flight_key(url, headers, params),
+            self._fetch, url, timeout, headers, params, cache_info
+        )
+        if shared:
+            # Result of other thread - do not share mutable objects
+            res = copy.copy(res)
+            if res.cache_info:
+                res.cache_info = res.cache_info.clone()
+        return res
+
+    def _get_cached(self, url, headers, params, cache_ext):
+        """
+        Look up url in cache
+
+        :param url: Url of request
+        :type url: str | unicode
+        :param headers: Headers of request
+        :type headers: dict
+        :param params: Parameters of request
+        :type params: None | dict
+        :param cache_ext: External cache info
+        :type cache_ext: None | floscraper.models.CacheInfo
+        :return: (Cached response, cache info, needs revalidation)
+            Cached response is None if url needs to be loaded
+        :rtype: (None | floscraper.models.Response,
+            None | floscraper.models.CacheInfo, bool)
+        :raises WEBConnectException: Failure of url is cached
+        """
         cached = cache_info = None
-        # TODO: add params to caching key
+        stale = False
         if self.cache:
-            cached, cache_info = self.cache.get(url)
+            cached, cache_info = self.cache.get_response(
+                url, ignore_access_time=bool(self.stale_while_revalidate),
+                params=params,
+                headers=self._request_headers(url, headers, params)
+            )
+            if cached and self.stale_while_revalidate \
+                    and self.cache.is_expired(cache_info):
+                stale = not self.cache.is_expired(
+                    cache_info,
+                    now_utc() - datetime.timedelta(
+                        seconds=self.stale_while_revalidate
+                    )
+                )
+                if not stale:
+                    cached = None
+            if cache_info and cache_info.error:
+                if cached and not self.cache.is_expired(cache_info):
+                    # Known to fail -> do not ask again yet
+                    self.debug("From cache (error) {}".format(url))
+                    raise WEBConnectException(cache_info.error)
+                # Expired failure -> load again
+                # (conditional request if a response is kept)
+                cached = None
+                if self.cache.has_response(cache_info):
+                    cache_info.error = None
+                else:
+                    cache_info = None
 
         if cache_ext:
             # Check local cache
@@ -305,29 +689,155 @@ class WebScraper(Loadable):
             # Using cached
             if cache_info:
                 cache_info.hit = True
-            return Response(cached, cache_info)
+            stale = stale and cache_info is not cache_ext
+            if stale:
+                cache_info.hit = "stale"
+            cached.cache_info = cache_info
+            return cached, cache_info, stale
         if cache_info:
             cache_info.hit = None
-        # Not using cached
+        return None, cache_info, False
+
+    def _cache_key(self, url, params=None):
+        """
+        Get cache key for request
+
+        :param url: Url of request
+        :type url: str | unicode
+        :param params: Parameters of request (default: None)
+        :type params: None | dict
+        :return: Key
+        :rtype: str | unicode
+        """
+        if self.cache:
+            return self.cache.key(url, params)
+        return canonical_url(url, params)
+
+    def _flight_key(self, url, headers, params=None):
+        """
+        Get key to coalesce requests by - only requests with same url,
+        params and request headers share one fetch
+
+        :param url: Url of request
+        :type url: str | unicode
+        :param headers: Headers of request
+        :type headers: None | dict
+        :param params: Parameters of request (default: None)
+        :type params: None | dict
+        :return: Key
+        :rtype: str | unicode
+        """
+        merged = self._request_headers(url, headers, params)
+        return "\n".join([self._cache_key(url, params)] + sorted(
+            "{}:{}".format(name.lower(), value)
+            for name, value in merged.items()
+        ))
+
+    def _request_headers(self, url, headers, params=None):
+        """
+        Get headers a request will be sent with (session, cookies, auth
+        and request)
 
+        :param url: Url of request
+        :type url: str | unicode
+        :param headers: Headers of request
+        :type headers: None | dict
+        :param params: Parameters of request (default: None)
+        :type params: None | dict
+        :return: Merged headers
+        :rtype: requests.structures.CaseInsensitiveDict
+        """
+        if not self.session:
+            self._browser_init()
+        try:
+            return self.session.prepare_request(requests.Request(
+                "GET", url, headers=headers, params=params
+            )).headers
+        except (ValueError, RequestException):
+            # Invalid url - fails when sent
+            res = CaseInsensitiveDict(self.session.headers)
+            res.update(headers or {})
+            return res
+
+    def _fetch(
+            self, url, timeout, headers, params, cache_info, store_error=True
+    ):
+        """
+        Load url from web (conditional request if cache info given)
+        and update cache
+
+        :param url: Url to make request to
+        :type url: str | unicode
+        :param timeout: Timeout for request
+        :type timeout: None | int | float
+        :param headers: Headers to be passed along
+        :type headers: dict
+        :param params: Parameters to be passed along with url
+        :type params: None | dict
+        :param cache_info: Cache info of previously cached response
+        :type cache_info: None | floscraper.models.CacheInfo
+        :param store_error: Remember failure in cache (default: True)
+        :type store_error: bool
+        :return: Response
+        :rtype: floscraper.models.Response
+        :raises WEBConnectException: Loading failed
+        """
         if not self.session:
             self._browser_init()
+        # Headers the response is cached for (without conditional headers)
+        request_headers = self._request_headers(url, headers, params)
 
         if self.cache:
             headers = self.cache.prepare_headers(headers, cache_info)
 
-        response = self._get(
-            url,
-            timeout=timeout,
-            headers=headers,
-            params=params
+        try:
+            response = self._get(
+                url,
+                timeout=timeout,
+                headers=headers,
+                params=params
+            )
+        except WEBConnectException as e:
+            if store_error:
+                self._put_error(
+                    url, params, request_headers, e, self.connect_error_ttl
+                )
+            raise
+        return self._handle_response(
+            url, params, request_headers, cache_info, response, store_error
         )
+
+    def _handle_response(
+            self, url, params, request_headers, cache_info, response,
+            store_error=True
+    ):
+        """
+        Process response of request and update cache
+
+        :param url: Url of request
+        :type url: str | unicode
+        :param params: Parameters of request
+        :type params: None | dict
+        :param request_headers: Headers of request (see _request_headers)
+        :type request_headers: requests.structures.CaseInsensitiveDict
+        :param cache_info: Cache info of previously cached response
+        :type cache_info: None | floscraper.models.CacheInfo
+        :param response: Response of request
+        :type response: requests.Response
+        :param store_error: Remember error response in cache (default: True)
+        :type store_error: bool
+        :return: Response
+        :rtype: floscraper.models.Response
+        :raises WEBConnectException: Error response
+        """
         if "etag" in response.headers:
             if not cache_info:
                 cache_info = CacheInfo()
             cache_info.etag = response.headers.get('etag')
 
         res = Response(cache_info=cache_info)
+        res.retries = getattr(response, "retries", 0)
+        res.retry_wait = getattr(response, "retry_wait", 0.0)
         if cache_info:
             cache_info.hit = False
 
@@ -355,151 +865,248 @@ class WebScraper(Loadable):
 
         if response.status_code == requests.codes.NOT_MODIFIED:
             self.info("Not modified {}".format(url))
-            res.html, _ = self.cache.get(url, ignore_access_time=True)
+            cached, _ = self.cache.get_response(
+                url, ignore_access_time=True, params=params,
+                headers=request_headers
+            )
+            if cached:
+                res.raw = cached.raw
+                res.status_code = cached.status_code
+                res.encoding = cached.encoding
             if cache_info:
                 cache_info.hit = True
+                # 304 may carry updated headers (e.g. Cache-Control)
+                cache_info.headers = dict(cache_info.headers or {})
+                cache_info.headers.update(
+                    self.cache.select_headers(response.headers)
+                )
+                res.headers = CaseInsensitiveDict(cache_info.headers)
+                _, cache_info.max_age = self.cache.freshness(
+                    CaseInsensitiveDict(cache_info.headers)
+                )
             if self.cache:
-                self.cache.update(url, cache_info)
+                self.cache.update(
+                    url, cache_info, params, request_headers
+                )
             return res
 
         try:
             response.raise_for_status()
         except HTTPError as e:
-            raise WEBConnectException("{} - {}".format(e, url))
+            err = WEBConnectException("{} - {}".format(e, url))
+            if store_error:
+                self._put_error(
+                    url, params, request_headers, err,
+                    self.error_ttl, response.status_code
+                )
+            raise err
 
         try:
             raw = response.content
-            html = response.text
             if raw is None:
                 self.warning("Response returned None")
                 raise Exception()
-            if html is None:
-                self.warning("Response parsed returned None")
-                raise Exception()
+            # Detect only once (stored with cache entry)
+            response.encoding = detect_encoding(
+                raw, response.headers.get('Content-Type'),
+                lambda: response.apparent_encoding
+            )
         except Exception:
             raise WEBConnectException("Unable to load {}".format(url))
 
-        # TODO: cache raw / whole response object
-        if self.cache:
-            self.cache.put(url, html, cache_info)
-        if url != response.url:
+        # html is decoded from raw on access
+        res.raw = raw
+        res.status_code = response.status_code
+        res.headers = CaseInsensitiveDict(response.headers)
+        res.encoding = response.encoding
+        store = False
+        vary = parse_vary(response.headers.get('Vary'))
+        if self.cache and vary != ["*"]:
+            store, max_age = self.cache.freshness(response.headers)
+        if store:
+            if not cache_info:
+                cache_info = CacheInfo()
+                cache_info.hit = False
+                res.cache_info = cache_info
+            cache_info.max_age = max_age
+            cache_info.vary = vary
+            cache_info.status_code = response.status_code
+            cache_info.headers = self.cache.select_headers(response.headers)
+            self.cache.put(
+                url, None, cache_info, raw, response.encoding,
+                params, request_headers
+            )
+        if canonical_url(url, params) != canonical_url(response.url):
             if not response.history:
                 self.warning(
                     "Response url different despite no redirects "
                     "{} - {}".format(url, response.url)
                 )
-            if self.cache:
-                self.cache.put(response.url, html, cache_info)
-        res.html = html
-        res.raw = raw
+            if store:
+                self.cache.put(
+                    response.url, None, cache_info, raw, response.encoding,
+                    headers=request_headers
+                )
         return res
 
-    def _get_tag_match(self, ele, tree):
+    def _put_error(
+            self, url, params, headers, error, ttl, status_code=None
+    ):
         """
-        Match tag
+        Remember failed request in cache (if enabled)
 
-        :param ele:
-        :type ele:
-        :param tree:
-        :type tree: None, list
-        :return:
-        :rtype: None | list
+        :param url: Url of request
+        :type url: str | unicode
+        :param params: Parameters of request
+        :type params: None | dict
+        :param headers: Headers of request
+        :type headers: dict | requests.structures.CaseInsensitiveDict
+        :param error: Error of request
+        :type error: Exception
+        :param ttl: Seconds to keep error (None -> do not cache)
+        :type ttl: None | int | float
+        :param status_code: Http status code of response (default: None)
+        :type status_code: None | int
+        :rtype: None
         """
-        if tree in [None, []]:
-            return [ele]
+        if not self.cache or ttl is None:
+            return
+        cache_info = CacheInfo()
+        cache_info.error = "{}".format(error)
+        cache_info.max_age = ttl
+        cache_info.status_code = status_code
+        self.cache.put_error(url, cache_info, params, headers)
 
-        res = []
-        t = tree[0]
-        branch = tree[1:]
-        attributes = {}
-
-        for attr in t:
-            if isinstance(t[attr], dict):
-                if t[attr].get("type", None) == "reg":
-                    t[attr] = re.compile(t[attr]['reg'])
-
-        attributes.update(t)
-
-        if "name" in attributes:
-            del attributes['name']
-        if "text" in attributes:
-            del attributes['text']
-        if "recursive" in attributes:
-            del attributes['recursive']
-        if "[]" in attributes:
-            del attributes['[]']
-
-        possibles = ele.find_all(
-            t.get('name', None),
-            text=t.get('text', None),
-            attrs=attributes,
-            recursive=t.get('recursive', True)
-        )
+    def _revalidate(self, url, timeout, headers, params, cache_info):
+        """
+        Refresh stale cache entry in background
 
-        if not possibles:
-            return None
-        else:
-            pass
+        :param url: Url to refresh
+        :type url: str | unicode
+        :param timeout: Timeout for request
+        :type timeout: None | int | float
+        :param headers: Headers to be passed along
+        :type headers: dict
+        :param params: Parameters to be passed along with url
+        :type params: None | dict
+        :param cache_info: Cache info of stale entry
+        :type cache_info: floscraper.models.CacheInfo
+        :rtype: None
+        """
+        key = self._flight_key(url, headers, params)
+        with self._revalidate_lock:
+            if key in self._revalidating:
+                # Already queued
+                return
+            self._revalidating.add(key)
+            if not self._revalidate_workers:
+                for i in range(self._stale_workers):
+                    worker = threading.Thread(
+                        target=self._revalidate_loop,
+                        name="WebScraper-revalidate-{}".format(i)
+                    )
+                    worker.daemon = True
+                    worker.start()
+                    self._revalidate_workers.append(worker)
+        self._revalidate_queue.put(
+            (key, url, timeout, dict(headers), params, cache_info)
+        )
 
-        if "[]" in t:
+    def _revalidate_loop(self):
+        while True:
+            key, url, timeout, headers, params, cache_info = \
+                self._revalidate_queue.get()
             try:
-                possibles = eval("possibles[{}]".format(t["[]"]))
-            except:
-                # no possibles
-                return None
-
-        if not isinstance(possibles, list):
-            possibles = [possibles]
-
-        for a in possibles:
-            match = self._get_tag_match(a, branch)
+                self._flight.do(
+                    key, self._fetch,
+                    url, timeout, headers, params, cache_info, False
+                )
+                self.debug("Revalidated {}".format(url))
+            except WEBConnectException as e:
+                self.warning("Failed to revalidate {}: {}".format(url, e))
+            except Exception:
+                self.exception("Failed to revalidate {}".format(url))
+            finally:
+                with self._revalidate_lock:
+                    self._revalidating.discard(key)
+
+    def compile_scheme(self, scheme):
+        """
+        Compile scheme for repeated use
 
-            if match:
-                res.extend(match)
+        :param scheme: Scheme to compile
+        :type scheme: dict | floscraper.scheme.CompiledScheme
+        :return: Compiled scheme
+        :rtype: floscraper.scheme.CompiledScheme
+        :raises WEBParameterException: Invalid scheme
+        """
+        if scheme is None or isinstance(scheme, CompiledScheme):
+            return scheme
+        try:
+            return CompiledScheme(scheme)
+        except (ValueError, KeyError, TypeError, re.error) as e:
+            raise WEBParameterException("Invalid scheme: {}".format(e))
 
-        if not res:
-            return None
-        else:
-            return res
+    def _default_scheme(self):
+        """
+        Get compiled default scheme (compiled again if self.scheme changed)
 
-    def _parse_value(self, eles, value_scheme):
+        :return: Compiled scheme
+        :rtype: None | floscraper.scheme.CompiledScheme
+        :raises WEBParameterException: Invalid scheme
         """
+        scheme = self.scheme
+        if scheme is None or isinstance(scheme, CompiledScheme):
+            return scheme
+        key = digest(scheme)
+        compiled = self._compiled_scheme
+        if compiled is None or key is None or compiled[0] != key:
+            compiled = (key, self.compile_scheme(scheme))
+            self._compiled_scheme = compiled
+        return compiled[1]
+
+    def _parse_value(self, eles, value_scheme, engine=None):
+        """
+        Get values from elements
 
-        :param eles:
+        :param eles: Elements to get values from
         :type eles: list
-        :param value_scheme:
-        :type value_scheme: dict
-        :return:
+        :param value_scheme: How to get value
+        :type value_scheme: floscraper.scheme.SchemeValue | dict
+        :param engine: Engine elements belong to (default: None - bs4)
+        :type engine: None | floscraper.engines.SoupEngine
+            | floscraper.engines.LxmlEngine
+        :return: Values
         :rtype: list
         """
+        if isinstance(value_scheme, dict):
+            value_scheme = SchemeValue(value_scheme)
+        if engine is None:
+            engine = self._soup_engine
         val = []
-        val_type = value_scheme.get('type', None)
-        reg = value_scheme.get('reg', None)
-        strip = value_scheme.get('strip', False)
+        val_type = value_scheme.type
+        reg = value_scheme.reg
+        strip = value_scheme.strip
 
         for match in eles:
             if val_type == "text":
-                val.append("{}".format(match.getText()))
+                val.append(engine.text(match))
             elif val_type == "content":
-                val.append("{}".format(match.getText()))
-            elif val_type == "attribute" and value_scheme.get("attribute", None):
-                attr = value_scheme['attribute']
-
-                if attr in match.attrs:
-                    res = match[attr]
+                val.append(engine.text(match))
+            elif val_type == "attribute" and value_scheme.attribute:
+                # multi-valued attributes will be joined in one string
+                res = engine.attribute(match, value_scheme.attribute)
 
-                    # multi-valued attributes will be joined in one string
-                    if isinstance(res, list):
-                        res = " ".join(res)
+                if res is not None:
                     val.append(res)
             elif val_type == "html":
-                val.append("{}".format(match))
+                val.append(engine.html(match))
             else:
                 # == html2text
                 if self._text_maker is None:
-                    val.append(html2text.html2text("{}".format(match)))
+                    val.append(html2text.html2text(engine.html(match)))
                 else:
-                    val.append(self._text_maker.handle("{}".format(match)))
+                    val.append(self._text_maker.handle(engine.html(match)))
             if strip:
                 # TODO: github date field
                 val[-1] = val[-1].strip()
@@ -508,63 +1115,63 @@ class WebScraper(Loadable):
             res = []
 
             for a in val:
-                if isinstance(reg, dict):
-                    if reg.get('type', None) == "reg":
-                        reg = re.compile(reg['reg'])
                 res.extend(reg.findall(a))
         else:
             res = val
 
         return res
 
-    def _parse_scheme(self, ele, scheme):
+    def _parse_scheme(self, ele, scheme, engine=None):
         """
-
-        :param ele:
-        :type ele:
-        :param scheme:
-        :type scheme: dict[str | unicode, dict]
-        :return:
+        Parse element according to scheme
+
+        :param ele: Element to parse
+        :type ele: bs4.element.Tag
+        :param scheme: Scheme to apply
+        :type scheme: floscraper.scheme.CompiledScheme | dict
+        :param engine: Engine element belongs to (default: None - bs4)
+        :type engine: None | floscraper.engines.SoupEngine
+            | floscraper.engines.LxmlEngine
+        :return: Parsed info
         :rtype: dict
         """
+        scheme = self.compile_scheme(scheme)
+        if engine is None:
+            engine = self._soup_engine
         res = {}
 
-        for aKey in scheme:
-            entity = scheme[aKey]
+        for field in scheme.fields:
             val = []
             matches = []
-            res[aKey] = []
+            res[field.key] = []
 
-            if "tree" in entity:
-                matches = self._get_tag_match(ele, entity['tree'])
+            if field.tree is not None:
+                matches = match_tree(
+                    ele, field.tree, find=engine.find
+                ) or []
 
+            if field.value is not None:
                 if not matches:
-                    matches = []
-                else:
-                    pass
-            else:
-                # matches = [ele]
-                pass
-
-            if not matches and "value" == aKey:
-                val.extend(self._parse_value([ele], entity))
-                res[aKey].extend(val)
-
-            if "value" == aKey:
+                    val.extend(
+                        self._parse_value([ele], field.value, engine)
+                    )
+                    res[field.key].extend(val)
                 for a in matches:
                     # TODO: sure it's ele and not a?
-                    val.extend(self._parse_value([ele], entity))
-            if "children" in entity:
+                    val.extend(
+                        self._parse_value([ele], field.value, engine)
+                    )
+            if field.children is not None:
                 for a in matches:
                     obj = {}
-                    if "value" == aKey:
+                    if field.value is not None:
                         obj['value'] = val
-                    child = self._parse_scheme(a, entity['children'])
+                    child = self._parse_scheme(a, field.children, engine)
 
                     if child:
                         obj.update(child)
                     if obj:
-                        res[aKey].append(obj)
+                        res[field.key].append(obj)
         return res
 
     def scrap(self,
@@ -592,7 +1199,7 @@ class WebScraper(Loadable):
         if not url:
             url = self.url
         if not scheme:
-            scheme = self.scheme
+            scheme = self._default_scheme()
         if not timeout:
             timeout = self.timeout
         if not html_parser:
@@ -601,11 +1208,266 @@ class WebScraper(Loadable):
             raise WEBParameterException("Missing scheme definition")
         if not url:
             raise WEBParameterException("Missing url definition")
+        scheme = self.compile_scheme(scheme)
         resp = self.get(url, timeout, cache_ext=cache_ext)
-        soup = BeautifulSoup(resp.html, html_parser)
-        resp.scraped = self._parse_scheme(soup, scheme)
+        resp.scraped = self._scrap_response(resp, scheme, html_parser)
         return resp
 
+    def _scraped_url(self, resp, scheme, html_parser):
+        """
+        Get cache url of scraped result
+
+        Built from hashes of body, scheme and settings changing results
+        (engine, parser, html2text)
+
+        :param resp: Response to scrap
+        :type resp: floscraper.models.Response
+        :param scheme: Scheme to apply to html
+        :type scheme: floscraper.scheme.CompiledScheme
+        :param html_parser: What html parser to use
+        :type html_parser: str | unicode
+        :return: Url (None if result is not cached)
+        :rtype: None | str | unicode
+        """
+        if not self.cache or self.scraped_cache_ttl is None:
+            return None
+        if resp.raw is not None:
+            content = hashlib.sha1(resp.raw)
+            content.update("\n{}".format(resp.encoding).encode("utf-8"))
+        elif resp.html is not None:
+            content = hashlib.sha1(resp.html.encode("utf-8"))
+        else:
+            return None
+        options = digest([
+            self.engine.name, html_parser, self._text_maker_settings
+        ])
+        if scheme.digest is None or options is None:
+            return None
+        return "scraped://{}/{}/{}".format(
+            content.hexdigest(), scheme.digest, options
+        )
+
+    def _scrap_response(self, resp, scheme, html_parser):
+        """
+        Parse response according to scheme (or get result from cache)
+
+        :param resp: Response to scrap
+        :type resp: floscraper.models.Response
+        :param scheme: Scheme to apply to html
+        :type scheme: floscraper.scheme.CompiledScheme
+        :param html_parser: What html parser to use
+        :type html_parser: str | unicode
+        :return: Parsed info
+        :rtype: dict
+        """
+        url = self._scraped_url(resp, scheme, html_parser)
+        if url:
+            data, _ = self.cache.get(url)
+            if data is not None:
+                try:
+                    scraped = json.loads(data)
+                except ValueError:
+                    self.exception("Failed to load scraped result")
+                else:
+                    self.debug("Scraped from cache {}".format(resp.url))
+                    return scraped
+        scraped = self._scrap_html(resp.html, scheme, html_parser)
+        if url:
+            cache_info = CacheInfo()
+            cache_info.max_age = self.scraped_cache_ttl
+            self.cache.put(url, json.dumps(scraped), cache_info)
+        return scraped
+
+    def _scrap_html(self, html, scheme, html_parser):
+        """
+        Parse html according to scheme
+
+        :param html: Html to parse
+        :type html: str | unicode
+        :param scheme: Scheme to apply to html
+        :type scheme: dict
+        :param html_parser: What html parser to use (bs4 engine)
+        :type html_parser: str | unicode
+        :return: Parsed info
+        :rtype: dict
+        """
+        scheme = self.compile_scheme(scheme)
+        engine = self.engine
+        doc = None
+
+        if engine.supports(scheme):
+            doc = engine.parse(html, html_parser, scheme)
+        if doc is None and engine is not self._soup_engine:
+            self.debug("Falling back to bs4 for scheme")
+            engine = self._soup_engine
+            doc = engine.parse(html, html_parser, scheme)
+        return self._parse_scheme(doc, scheme, engine)
+
+    def download(
+            self, url, sink, timeout=None, headers=None, params=None
+    ):
+        """
+        Stream url into file (not cached)
+
+        :param url: Url to download
+        :type url: str | unicode
+        :param sink: Path or file object to write body to
+        :type sink: str | unicode | file
+        :param timeout: Timeout for request (default: None)
+        :type timeout: None | int | float
+        :param headers: Headers to be passed along (default: None)
+        :type headers: None | dict
+        :param params: Parameters to be passed along with url (default: None)
+        :type params: None | dict
+        :return: Response (without body)
+        :rtype: floscraper.models.Response
+        :raises WEBConnectException: Loading failed
+        """
+        path = None
+        if not hasattr(sink, "write"):
+            path = sink
+            sink = open(path, "wb")
+        try:
+            response = self._get(
+                url, timeout=timeout, headers=headers, params=params,
+                sink=sink
+            )
+        except:
+            if path is not None:
+                sink.close()
+                os.remove(path)
+            raise
+        if path is not None:
+            sink.close()
+        return self._download_response(url, response, path)
+
+    def _download_response(self, url, response, path=None):
+        """
+        Response of download
+
+        :param url: Requested url
+        :type url: str | unicode
+        :param response: Response of request
+        :type response: requests.Response
+        :param path: Path of written file (default: None)
+        :type path: None | str | unicode
+        :return: Response (without body)
+        :rtype: floscraper.models.Response
+        :raises WEBConnectException: Error response
+        """
+        try:
+            response.raise_for_status()
+        except HTTPError as e:
+            if path is not None:
+                os.remove(path)
+            raise WEBConnectException("{} - {}".format(e, url))
+        res = Response()
+        res.url = url
+        res.status_code = response.status_code
+        res.headers = CaseInsensitiveDict(response.headers)
+        res.encoding = response.encoding
+        res.retries = getattr(response, "retries", 0)
+        res.retry_wait = getattr(response, "retry_wait", 0.0)
+        return res
+
+    def get_many(
+            self, urls, max_workers=10, per_host_limit=None, timeout=None,
+            headers=None, params=None
+    ):
+        """
+        Make get requests to urls concurrently (might use cache)
+
+        Responses are yielded as they complete (not in order of urls).
+        Failed requests yield a response with error set instead of raising
+
+        :param urls: Urls to request (read lazily)
+        :type urls: collections.Iterable[str | unicode]
+        :param max_workers: Maximum number of simultaneous requests
+            (default: 10)
+        :type max_workers: int
+        :param per_host_limit: Maximum number of simultaneous requests
+            per host (default: None - no limit)
+        :type per_host_limit: None | int
+        :param timeout: Timeout for request (default: None)
+        :type timeout: None | int | float
+        :param headers: Headers to be passed along (default: None)
+        :type headers: None | dict
+        :param params: Parameters to be passed along with url (default: None)
+        :type params: None | dict
+        :return: Responses (with url set)
+        :rtype: collections.Iterable[floscraper.models.Response]
+        """
+        def get(url):
+            # Copy headers - cache adds conditional headers
+            return self.get(url, timeout, dict(headers or {}), params)
+
+        return self._many(get, urls, max_workers, per_host_limit)
+
+    def scrap_many(
+            self, urls, scheme=None, max_workers=10, per_host_limit=None,
+            timeout=None, html_parser=None
+    ):
+        """
+        Scrap urls concurrently and parse the content according to scheme
+
+        Responses are yielded as they complete (not in order of urls).
+        Failed requests yield a response with error set instead of raising
+
+        :param urls: Urls to parse (read lazily)
+        :type urls: collections.Iterable[str | unicode]
+        :param scheme: Scheme to apply to html (default: self._scheme)
+        :type scheme: dict
+        :param max_workers: Maximum number of simultaneous requests
+            (default: 10)
+        :type max_workers: int
+        :param per_host_limit: Maximum number of simultaneous requests
+            per host (default: None - no limit)
+        :type per_host_limit: None | int
+        :param timeout: Timeout for http operation (default: self._timout)
+        :type timeout: float
+        :param html_parser: What html parser to use
+            (default: self._html_parser)
+        :type html_parser: str | unicode
+        :return: Responses (with url set)
+        :rtype: collections.Iterable[floscraper.models.Response]
+        """
+        # Compile once for all urls
+        scheme = self.compile_scheme(scheme) or self._default_scheme()
+
+        def scrap(url):
+            return self.scrap(url, scheme, timeout, html_parser)
+
+        return self._many(scrap, urls, max_workers, per_host_limit)
+
+    def _many(self, func, urls, max_workers, per_host_limit):
+        for url, res, error in imap_unordered(
+                func, urls, max_workers, _host, per_host_limit
+        ):
+            yield self._many_result(url, res, error)
+
+    def _many_result(self, url, res, error):
+        """
+        Response of one request of get_many/scrap_many
+
+        :param url: Requested url
+        :type url: str | unicode
+        :param res: Response (None if failed)
+        :type res: None | floscraper.models.Response
+        :param error: Exception of failed request
+        :type error: None | Exception
+        :return: Response (with url and error set)
+        :rtype: floscraper.models.Response
+        """
+        if error is not None:
+            if not isinstance(
+                    error, (WEBConnectException, WEBParameterException)
+            ):
+                self.error("Failed to load {}: {!r}".format(url, error))
+            res = Response()
+            res.error = "{}".format(error)
+        res.url = url
+        return res
+
     def _shrink_list(self, shrink):
         """
         Shrink list down to essentials